@@ -1,5 +1,10 @@
+import logging
+import multiprocessing
 import sys
 import os
+import time
+
+START_TIME = time.perf_counter()
 
 from PyQt6.QtWidgets import QApplication
 from main import MainWindow
@@ -9,11 +14,42 @@ def sync():
     app.sync()
 
 
-app = QApplication(sys.argv)
-os.environ["theme"] = "light"
-os.environ["TRAIN_EPOCHS"] = "100"
-os.environ["INTERPOLATION"] = "TRUE"
-os.environ["INTERPOLATION_STEP"] = "3"
-window = MainWindow()
-window.show()
-app.exec()
+if __name__ == '__main__':
+    # video shards are stylized in spawned processes which import this module again
+    multiprocessing.freeze_support()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    app = QApplication(sys.argv)
+    os.environ["theme"] = "light"
+    os.environ["TRAIN_EPOCHS"] = "100"
+    os.environ["MORPH_CACHE_ENTRIES"] = "16"
+    os.environ["MORPH_PLATEAU_WINDOW"] = "20"
+    os.environ["MORPH_PLATEAU_TOLERANCE"] = "0.001"
+    os.environ["MORPH_PYRAMID"] = "128:0.5,256:0.3,1024:0.2"
+    os.environ["MORPH_BATCH_SIZE"] = "4"
+    os.environ["MORPH_FRAME_CACHE"] = "8"
+    os.environ["INTERPOLATION"] = "TRUE"
+    os.environ["INTERPOLATION_STEP"] = "3"
+    os.environ["INTERPOLATION_MODE"] = "BLEND"
+    os.environ["MOTION_THRESHOLD"] = "8.0"
+    os.environ["SCENE_DETECTION"] = "FALSE"
+    os.environ["CONTENT_CHANGE_THRESHOLD"] = "0.2"
+    os.environ["SCENE_CUT_THRESHOLD"] = "0.5"
+    os.environ["DUPLICATE_DETECTION"] = "FALSE"
+    os.environ["DUPLICATE_THRESHOLD"] = "2"
+    os.environ["DUPLICATE_CACHE_SIZE"] = "16"
+    os.environ["VIDEO_BATCH_SIZE"] = "4"
+    os.environ["VIDEO_SHARDS"] = "1"
+    os.environ["VIDEO_KEEP_RESOLUTION"] = "FALSE"
+    os.environ["VIDEO_SEGMENT_FRAMES"] = "300"
+    os.environ["TILED_OUTPUT"] = "FALSE"
+    os.environ["TILE_OVERLAP"] = "64"
+    os.environ["TILE_BATCH_SIZE"] = "4"
+    os.environ["TILE_WORKERS"] = "2"
+    os.environ["STYLE_CACHE_MEMORY_ENTRIES"] = "32"
+    os.environ["STYLE_CACHE_DISK_ENTRIES"] = "256"
+    os.environ["IMAGE_CACHE_MEGABYTES"] = "256"
+    window = MainWindow()
+    window.show()
+    logging.getLogger().info(f'Window shown {time.perf_counter() - START_TIME:.2f} s after start')
+    app.exec()
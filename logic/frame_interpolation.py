@@ -0,0 +1,190 @@
+from enum import Enum
+
+from collections import deque
+
+import cv2 as cv
+import numpy as np
+
+
+class InterpolationMode(Enum):
+    """Enum which defines how frames between stylized keyframes are created"""
+    BLEND = "BLEND"
+    FLOW = "FLOW"
+
+
+def compute_optical_flow(from_guide, to_guide):
+    """Dense optical flow between two grayscale frames
+    :param from_guide: grayscale frame for which the flow is calculated
+    :param to_guide: grayscale frame to which pixels of from_guide are moved
+    :return: float32 array (height, width, 2) such that from_guide[y, x] ~ to_guide[y + flow_y, x + flow_x]"""
+    return cv.calcOpticalFlowFarneback(from_guide, to_guide, None, pyr_scale=0.5, levels=3, winsize=15,
+                                       iterations=3, poly_n=5, poly_sigma=1.2, flags=0)
+
+
+def warp_with_optical_flow(image, flow):
+    """Move pixels of image along the flow, see compute_optical_flow()
+    :param image: image of the same height and width as the flow
+    :param flow: flow from the frame which is created to the frame of the image
+    :return: warped image"""
+    height, width = flow.shape[:2]
+    grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+    return cv.remap(image, grid_x + flow[..., 0], grid_y + flow[..., 1], cv.INTER_LINEAR,
+                    borderMode=cv.BORDER_REPLICATE)
+
+
+def measure_motion(prev_guide, guide, size: int = 96):
+    """Cheap estimation of motion between two consecutive frames
+    :param prev_guide: grayscale previous frame
+    :param guide: grayscale current frame
+    :param size: size to which frames are downscaled before calculating the flow
+    :return: mean length of motion vectors in pixels of the guide"""
+    scale = guide.shape[1] / size
+    flow = compute_optical_flow(cv.resize(prev_guide, (size, size), interpolation=cv.INTER_AREA),
+                                cv.resize(guide, (size, size), interpolation=cv.INTER_AREA))
+    return float(np.mean(np.linalg.norm(flow, axis=-1))) * scale
+
+
+def compute_frame_signature(image, size: int = 64):
+    """Cheap description of frame content used to detect changes of the content and scene cuts
+    :param image: opencv image with BGR color coding
+    :param size: size to which the frame is downscaled before calculating the histogram
+    :return: normalized hue-saturation histogram"""
+    small_image = cv.resize(image, (size, size), interpolation=cv.INTER_AREA)
+    hsv_image = cv.cvtColor(small_image, cv.COLOR_BGR2HSV)
+    histogram = cv.calcHist([hsv_image], [0, 1], None, [16, 8], [0, 180, 0, 256])
+    return cv.normalize(histogram, histogram, 1.0, 0.0, cv.NORM_L1)
+
+
+def compare_frame_signatures(signature, other_signature) -> float:
+    """:return: difference of two frame signatures between 0.0 (same content) and 1.0 (nothing in common)"""
+    return float(cv.compareHist(signature, other_signature, cv.HISTCMP_BHATTACHARYYA))
+
+
+def compute_perceptual_hash(image, hash_size: int = 8) -> int:
+    """Difference hash of a frame, frames which look almost the same have hashes differing in a few bits
+    :param image: opencv image with BGR color coding
+    :param hash_size: the hash has hash_size * hash_size bits
+    :return: hash as an integer"""
+    gray_image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    small_image = cv.resize(gray_image, (hash_size + 1, hash_size), interpolation=cv.INTER_AREA)
+    bits = (small_image[:, 1:] > small_image[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def interpolate_frames(prev_frame, prev_guide, next_frame, next_guide, guides: list, mode: InterpolationMode):
+    """Create frames between two stylized keyframes
+    :param prev_frame: stylized keyframe before the created frames
+    :param prev_guide: grayscale source frame of prev_frame, used only with FLOW mode
+    :param next_frame: stylized keyframe after the created frames or None at the end of the video
+    :param next_guide: grayscale source frame of next_frame, used only with FLOW mode
+    :param guides: grayscale source frames of created frames in order, None values with BLEND mode
+    :param mode: BLEND cross-fades keyframes, FLOW warps keyframes along optical flow of source frames
+    :return: list of created frames"""
+    frames = []
+    for i, guide in enumerate(guides, start=1):
+        weight = i / (len(guides) + 1)
+
+        if mode == InterpolationMode.FLOW:
+            warped_prev_frame = warp_with_optical_flow(prev_frame, compute_optical_flow(guide, prev_guide))
+            if next_frame is None:
+                frames.append(warped_prev_frame)
+                continue
+
+            warped_next_frame = warp_with_optical_flow(next_frame, compute_optical_flow(guide, next_guide))
+            frames.append(cv.addWeighted(warped_next_frame, weight, warped_prev_frame, 1 - weight, 0))
+        elif next_frame is None:
+            frames.append(prev_frame)
+        else:
+            frames.append(cv.addWeighted(next_frame, weight, prev_frame, 1 - weight, 1))
+
+    return frames
+
+
+class KeyframeSelector:
+    """Decides which frames of a video are stylized, the rest is interpolated from the nearest stylized keyframes.
+    Without adaptive triggers every interpolation_step-th frame is a keyframe. With FLOW mode a new keyframe is
+    selected when accumulated motion since the last one exceeds motion_threshold. With scene detection a new
+    keyframe is selected when the content differs from the last keyframe by content_change_threshold, and it is
+    forced at every scene cut. A keyframe is selected at the latest after interpolation_step frames"""
+
+    def __init__(self, mode: InterpolationMode, interpolation_step: int, motion_threshold: float,
+                 scene_detection: bool = False, content_change_threshold: float = 0.2,
+                 scene_cut_threshold: float = 0.5):
+        """
+        :param mode: interpolation mode
+        :param interpolation_step: maximum distance between keyframes, 1 stylizes every frame
+        :param motion_threshold: accumulated motion in pixels which requires a new keyframe, used with FLOW mode
+        :param scene_detection: if frame signatures are used to select keyframes
+        :param content_change_threshold: difference from the last keyframe which requires a new keyframe
+        :param scene_cut_threshold: difference between consecutive frames which is considered a scene cut
+        """
+        self.mode = mode
+        self.interpolation_step = max(interpolation_step, 1)
+        self.motion_threshold = motion_threshold
+        self.scene_detection = scene_detection and self.interpolation_step > 1
+        self.content_change_threshold = content_change_threshold
+        self.scene_cut_threshold = scene_cut_threshold
+
+        self.frames_since_keyframe = None
+        self.accumulated_motion = 0.0
+        self.prev_guide = None
+        self.prev_signature = None
+        self.keyframe_signature = None
+
+    def needs_guides(self) -> bool:
+        """:return: if grayscale guide frames have to be passed to select()"""
+        return self.mode == InterpolationMode.FLOW and self.interpolation_step > 1
+
+    def needs_signatures(self) -> bool:
+        """:return: if frame signatures have to be passed to select()"""
+        return self.scene_detection
+
+    def select(self, record, guide, signature):
+        """Decide if the next frame of the video is stylized, sets is_keyframe and scene_cut of the record
+        :param record: FrameRecord of the frame
+        :param guide: grayscale frame or None if guides are not needed
+        :param signature: signature of the frame or None if signatures are not needed"""
+        if self.needs_guides() and self.prev_guide is not None:
+            self.accumulated_motion += measure_motion(self.prev_guide, guide)
+        self.prev_guide = guide
+
+        if self.needs_signatures() and self.prev_signature is not None:
+            record.scene_cut = compare_frame_signatures(self.prev_signature, signature) >= self.scene_cut_threshold
+        self.prev_signature = signature
+
+        if self.frames_since_keyframe is not None:
+            self.frames_since_keyframe += 1
+
+        record.is_keyframe = self.frames_since_keyframe is None or record.scene_cut or \
+            self.frames_since_keyframe >= self.interpolation_step or \
+            (self.needs_guides() and self.accumulated_motion >= self.motion_threshold) or \
+            (self.needs_signatures() and compare_frame_signatures(self.keyframe_signature, signature) >=
+             self.content_change_threshold)
+
+        if record.is_keyframe:
+            self.frames_since_keyframe = 0
+            self.accumulated_motion = 0.0
+            self.keyframe_signature = signature
+
+
+class DuplicateFrameCache:
+    """Perceptual hashes of recently stylized frames, a frame matching one of them reuses its stylized result"""
+
+    def __init__(self, max_distance: int, cache_size: int):
+        """
+        :param max_distance: maximum number of different bits of hashes of duplicate frames
+        :param cache_size: number of recent stylized frames which are remembered
+        """
+        self.max_distance = max_distance
+        self.entries = deque(maxlen=max(cache_size, 1))
+
+    def find(self, frame_hash: int):
+        """:return: the most recent remembered frame matching the hash or None"""
+        for entry_hash, frame in reversed(self.entries):
+            if (entry_hash ^ frame_hash).bit_count() <= self.max_distance:
+                return frame
+        return None
+
+    def add(self, frame_hash: int, frame):
+        """Remember a stylized frame, the oldest one is forgotten if the cache is full"""
+        self.entries.append((frame_hash, frame))
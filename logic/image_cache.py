@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2 as cv
+import numpy as np
+import requests
+
+from logic.wikiart import get_wikiart_client
+
+
+class ImageCache:
+    """Process-wide cache of images keyed by url or file path, it holds both the raw bytes and the decoded image,
+    so an image shown in a preview and then used by the models is downloaded and decoded only once. Least recently
+    used images are evicted when the total size of cached bytes and arrays exceeds max_bytes. Cached file paths are
+    checked for modification time and size, so a changed file is read again"""
+
+    def __init__(self, max_bytes: int, timeout: float = 10.0, session: requests.Session = None):
+        """
+        :param max_bytes: maximum total size of cached raw bytes and decoded arrays
+        :param timeout: timeout of a download in seconds
+        :param session: session used for downloads, e.g. the pooled and retrying session of the WikiArt client
+        """
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.session = session if session is not None else requests.Session()
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_url(source: str) -> bool:
+        return source.startswith(('http://', 'https://'))
+
+    def get_bytes(self, source: str) -> bytes:
+        """:return: raw content of the image at url or file path, it is read only if it is not cached"""
+        entry = self._get_entry(source)
+        if entry is not None:
+            return entry['bytes']
+
+        if ImageCache.is_url(source):
+            response = self.session.get(source, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.content
+        else:
+            with open(source, 'rb') as image_file:
+                data = image_file.read()
+
+        self.put_bytes(source, data)
+        return data
+
+    def put_bytes(self, source: str, data: bytes):
+        """Cache raw content of an image which was already read, e.g. downloaded for a preview"""
+        self._put_entry(source, {'bytes': data, 'array': None, 'stat': ImageCache._stat(source)})
+
+    def get_array(self, source: str):
+        """Return decoded image, it is decoded only once and shared between callers, so it is read-only
+        :param source: url or file path
+        :return: uint8 numpy array of shape (height, width, rgb=3)"""
+        data = self.get_bytes(source)
+        with self._lock:
+            entry = self._entries.get(source)
+            if entry is not None and entry['array'] is not None:
+                return entry['array']
+
+        # pixels are kept as stored like in the decoder used before the cache, EXIF orientation is not applied
+        image = cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR | cv.IMREAD_IGNORE_ORIENTATION)
+        if image is None:
+            raise ValueError(f'Could not decode image {source}')
+        image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
+        image.flags.writeable = False
+
+        with self._lock:
+            entry = self._entries.get(source)
+            if entry is not None and entry['bytes'] is data and entry['array'] is None:
+                entry['array'] = image
+                self._size += image.nbytes
+                self._evict()
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _get_entry(self, source: str):
+        with self._lock:
+            entry = self._entries.get(source)
+            if entry is None:
+                return None
+
+            if entry['stat'] != ImageCache._stat(source):
+                self._remove(source)
+                return None
+
+            self._entries.move_to_end(source)
+            return entry
+
+    def _put_entry(self, source: str, entry: dict):
+        with self._lock:
+            if source in self._entries:
+                self._remove(source)
+            self._entries[source] = entry
+            self._size += len(entry['bytes'])
+            self._evict()
+
+    def _evict(self):
+        # the newest entry is kept even if it alone exceeds the limit, it is used right after it was added
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, source: str):
+        entry = self._entries.pop(source)
+        self._size -= len(entry['bytes'])
+        if entry['array'] is not None:
+            self._size -= entry['array'].nbytes
+
+    @staticmethod
+    def _stat(source: str):
+        if ImageCache.is_url(source):
+            return None
+        try:
+            file_stat = os.stat(source)
+        except OSError:
+            return None
+        return file_stat.st_mtime_ns, file_stat.st_size
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """:return: cache shared by the whole application, its size is set by IMAGE_CACHE_MEGABYTES, images are
+    downloaded through the session of the shared WikiArt client"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ImageCache(int(os.getenv("IMAGE_CACHE_MEGABYTES", "256")) * 1024 * 1024,
+                                        session=get_wikiart_client().session)
+        return _default_cache
@@ -0,0 +1,52 @@
+import threading
+from contextlib import contextmanager
+
+
+class InterpreterPool:
+    """Pool of TFLite interpreters with already allocated tensors, interpreters are kept per model path and
+    input shapes, so they are loaded and allocated once and then reused between calls and stylization modes"""
+
+    def __init__(self):
+        self._idle_interpreters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, model_path: str, input_shapes):
+        """Borrow an interpreter for the given model, it is returned to the pool when the context exits.
+        Interpreters are never shared between threads at the same time, a new one is created if all are busy
+        :param model_path: path to .tflite model
+        :param input_shapes: shapes of all model inputs in the order of interpreter.get_input_details()
+        :return: interpreter with allocated tensors matching input_shapes"""
+        key = (model_path, tuple(tuple(int(dim) for dim in shape) for shape in input_shapes))
+
+        with self._lock:
+            idle = self._idle_interpreters.setdefault(key, [])
+            interpreter = idle.pop() if idle else None
+
+        if interpreter is None:
+            interpreter = self._create_interpreter(*key)
+
+        try:
+            yield interpreter
+        finally:
+            with self._lock:
+                self._idle_interpreters[key].append(interpreter)
+
+    def clear(self):
+        """Drop all idle interpreters, e.g. after models on disk have changed"""
+        with self._lock:
+            self._idle_interpreters.clear()
+
+    @staticmethod
+    def _create_interpreter(model_path: str, input_shapes):
+        # TensorFlow is imported by the first interpreter, normally in the warm-up thread instead of at startup
+        import tensorflow as tf
+
+        interpreter = tf.lite.Interpreter(model_path=model_path)
+
+        for details, shape in zip(interpreter.get_input_details(), input_shapes):
+            if tuple(details["shape"]) != shape:
+                interpreter.resize_tensor_input(details["index"], shape)
+
+        interpreter.allocate_tensors()
+        return interpreter
@@ -0,0 +1,157 @@
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+from pathlib import Path
+
+import requests
+
+
+class ModelRegistry:
+    """Local registry of model files described by a manifest, every model has its own file name, download url and
+    sha256 checksum once it is pinned. Models are only read from the models directory, so the application never
+    touches the network, they are downloaded by the fetch command:
+
+        python -m logic.model_registry fetch
+
+    A model is checked once on first use and its path is reused afterwards. Checksums are pinned by maintainers
+    with the pin command and committed with the manifest, fetching never changes them. Only models with a pinned
+    checksum are verified, the others are used with a warning"""
+
+    MODELS_DIRECTORY = 'assets/models'
+    MANIFEST_NAME = 'manifest.json'
+
+    def __init__(self, directory: str = MODELS_DIRECTORY):
+        """:param directory: directory with the manifest and model files, e.g. models bundled with the application"""
+        self.directory = Path(directory)
+        self.manifest = None
+        self._checked_paths = {}
+        self._lock = threading.Lock()
+
+    def load_manifest(self) -> dict:
+        """:return: manifest entries by model name, the manifest is read only once"""
+        if self.manifest is None:
+            with open(self.directory / ModelRegistry.MANIFEST_NAME) as manifest_file:
+                self.manifest = json.load(manifest_file)['models']
+        return self.manifest
+
+    def save_manifest(self):
+        """Atomically write the manifest, e.g. with newly pinned checksums"""
+        temporary_path = self.directory / f'{ModelRegistry.MANIFEST_NAME}.tmp'
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump({'models': self.load_manifest()}, manifest_file, indent=2)
+            manifest_file.write('\n')
+        os.replace(temporary_path, self.directory / ModelRegistry.MANIFEST_NAME)
+
+    def get_model_path(self, name: str) -> str:
+        """Return path to a model file, it is safe to call from any thread
+        :param name: name of the model in the manifest
+        :return: path to the model file
+        :raise FileNotFoundError: if the model is not in the models directory
+        :raise ValueError: if the model has a pinned checksum and does not match it"""
+        with self._lock:
+            if name not in self._checked_paths:
+                self._checked_paths[name] = self._check(name)
+            return self._checked_paths[name]
+
+    def fetch(self, names: list = None):
+        """Download missing models and verify those which have a pinned checksum
+        :param names: names of models to fetch, all models if it is None
+        :raise ValueError: if a model has a pinned checksum and does not match it"""
+        manifest = self.load_manifest()
+        logger = logging.getLogger()
+
+        for name in names or list(manifest):
+            entry = manifest[name]
+            path = self.directory / entry['file']
+
+            if not path.exists():
+                if not entry.get('url'):
+                    logger.warning(f'Model {name} has no download url, put {entry["file"]} to {self.directory}')
+                    continue
+
+                logger.info(f'Downloading model {name} from {entry["url"]}')
+                temporary_path = path.with_name(path.name + '.part')
+                with requests.get(entry['url'], stream=True, timeout=60) as response:
+                    response.raise_for_status()
+                    with open(temporary_path, 'wb') as model_file:
+                        for chunk in response.iter_content(chunk_size=1 << 20):
+                            model_file.write(chunk)
+                os.replace(temporary_path, path)
+
+            if entry.get('sha256') is None:
+                logger.warning(f'Model {name} has no pinned checksum, it is not verified')
+            elif ModelRegistry.file_sha256(path) != entry['sha256']:
+                raise ValueError(f'Model {name} at {path} does not match its pinned checksum')
+
+    def pin(self, names: list = None):
+        """Write checksums of models in the models directory to the manifest, meant for maintainers who then commit
+        the manifest, so every fetch is verified against them
+        :param names: names of models to pin, all models if it is None"""
+        manifest = self.load_manifest()
+        logger = logging.getLogger()
+
+        for name in names or list(manifest):
+            path = self.directory / manifest[name]['file']
+            if not path.exists():
+                logger.warning(f'Model {name} is missing at {path}, it is not pinned')
+                continue
+
+            manifest[name]['sha256'] = ModelRegistry.file_sha256(path)
+            logger.info(f'Pinned model {name}: {manifest[name]["sha256"]}')
+
+        self.save_manifest()
+
+    @staticmethod
+    def file_sha256(path) -> str:
+        """:return: hex digest of a file, the file is memory-mapped instead of being read into memory"""
+        with open(path, 'rb') as model_file:
+            if os.fstat(model_file.fileno()).st_size == 0:
+                return hashlib.sha256().hexdigest()
+            with mmap.mmap(model_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                return hashlib.sha256(mapped_file).hexdigest()
+
+    def _check(self, name: str) -> str:
+        entry = self.load_manifest()[name]
+        path = self.directory / entry['file']
+        if not path.exists():
+            raise FileNotFoundError(f'Model {name} is missing at {path}, run: python -m logic.model_registry fetch')
+
+        if entry.get('sha256') is None:
+            logging.getLogger().warning(f'Model {name} has no pinned checksum, it is not verified')
+        elif ModelRegistry.file_sha256(path) != entry['sha256']:
+            raise ValueError(f'Model {name} at {path} does not match its pinned checksum')
+
+        return str(path)
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """:return: registry shared by the whole application, MODELS_DIRECTORY environment variable overrides its
+    directory"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ModelRegistry(os.getenv("MODELS_DIRECTORY", ModelRegistry.MODELS_DIRECTORY))
+        return _default_registry
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download models or pin their checksums')
+    parser.add_argument('command', choices=['fetch', 'pin'])
+    parser.add_argument('names', nargs='*', help='names of models in the manifest, all models by default')
+    parser.add_argument('--directory', default=os.getenv("MODELS_DIRECTORY", ModelRegistry.MODELS_DIRECTORY))
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    registry = ModelRegistry(arguments.directory)
+    if arguments.command == 'pin':
+        registry.pin(arguments.names)
+    else:
+        registry.fetch(arguments.names)
@@ -1,12 +1,16 @@
+import logging
 import os
 import sys
+import threading
+from collections import OrderedDict, deque
 
 import cv2
 import numpy as np
 import tensorflow as tf
 import tensorflow_addons as tfa
 from PyQt6.QtCore import pyqtSignal
-from tqdm import tqdm
+
+from logic.warp_map_cache import WarpMapCache
 
 ORIG_WIDTH = 0
 ORIG_HEIGHT = 0
@@ -19,31 +23,103 @@ mult_scale = 0.4
 add_scale = 0.4
 add_first = False
 
+WARP_MAP_CACHE_DIRECTORY = 'assets/cache/warp-maps'
+warp_map_cache = None
+
 
 @tf.function
-def warp(origins, targets, preds_org, preds_trg):
+def warp(origins, targets, preds_org, preds_trg, size: int = im_sz):
+    """Warp both images with predicted maps, displacements are relative to size, so the same maps warp images of
+    any resolution"""
     if add_first:
         res_targets = tfa.image.dense_image_warp(
             (origins + preds_org[:, :, :, 3:6] * 2 * add_scale)
             * tf.maximum(0.1, 1 + preds_org[:, :, :, 0:3] * mult_scale),
-            preds_org[:, :, :, 6:8] * im_sz * warp_scale)
+            preds_org[:, :, :, 6:8] * size * warp_scale)
         res_origins = tfa.image.dense_image_warp(
             (targets + preds_trg[:, :, :, 3:6] * 2 * add_scale)
             * tf.maximum(0.1, 1 + preds_trg[:, :, :, 0:3] * mult_scale),
-            preds_trg[:, :, :, 6:8] * im_sz * warp_scale)
+            preds_trg[:, :, :, 6:8] * size * warp_scale)
     else:
         res_targets = tfa.image.dense_image_warp(
             origins * tf.maximum(
                 0.1, 1 + preds_org[:, :, :, 0:3] * mult_scale) + preds_org[:, :, :, 3:6] * 2 * add_scale,
-                preds_org[:, :, :, 6:8] * im_sz * warp_scale)
+                preds_org[:, :, :, 6:8] * size * warp_scale)
         res_origins = tfa.image.dense_image_warp(
             targets * tf.maximum(
                 0.1, 1 + preds_trg[:, :, :, 0:3] * mult_scale) + preds_trg[:, :, :, 3:6] * 2 * add_scale,
-                preds_trg[:, :, :, 6:8] * im_sz * warp_scale)
+                preds_trg[:, :, :, 6:8] * size * warp_scale)
 
     return res_targets, res_origins
 
 
+def get_warp_map_cache() -> WarpMapCache:
+    global warp_map_cache
+    if warp_map_cache is None:
+        warp_map_cache = WarpMapCache(WARP_MAP_CACHE_DIRECTORY, int(os.getenv("MORPH_CACHE_ENTRIES", "16")))
+    return warp_map_cache
+
+
+def get_warp_parameters() -> dict:
+    """:return: values which change trained warp maps besides the images and the number of epochs"""
+    return {'im_sz': im_sz, 'mp_sz': mp_sz, 'warp_scale': warp_scale, 'mult_scale': mult_scale,
+            'add_scale': add_scale, 'add_first': add_first}
+
+
+class ConvergenceMonitor:
+    """Detects a plateau of the training loss, training is converged when the mean loss of the last window of
+    epochs improved less than tolerance relative to the window before it"""
+
+    def __init__(self, window: int, tolerance: float):
+        """
+        :param window: number of epochs averaged to smooth out noise of the loss
+        :param tolerance: relative improvement below which the loss is considered flat
+        """
+        self.window = max(window, 1)
+        self.tolerance = tolerance
+        self.losses = deque(maxlen=self.window * 2)
+        self.progress = 0.0
+
+    def update(self, loss: float) -> bool:
+        """Add loss of the next epoch
+        :return: if the training converged"""
+        self.losses.append(loss)
+        if len(self.losses) < self.losses.maxlen or self.tolerance <= 0:
+            return False
+
+        losses = list(self.losses)
+        previous_loss = float(np.mean(losses[:self.window]))
+        current_loss = float(np.mean(losses[self.window:]))
+        improvement = (previous_loss - current_loss) / max(abs(previous_loss), 1e-12)
+
+        # progress towards the loss plateau, it never goes back
+        self.progress = max(self.progress, min(self.tolerance / max(improvement, 1e-12), 1.0))
+        return improvement < self.tolerance
+
+
+def get_pyramid_levels(epochs: int) -> list:
+    """Coarse-to-fine schedule of training defined by MORPH_PYRAMID as comma separated size:fraction pairs, e.g.
+    128:0.6,256:0.3,1024:0.1 trains 60 % of epochs with images downscaled to 128 pixels. Sizes are capped by im_sz
+    and the last level always trains in full resolution
+    :param epochs: number of epochs of the whole training
+    :return: list of tuples of image size and the epoch at which the level ends"""
+    schedule = []
+    for level in os.getenv("MORPH_PYRAMID", f"{im_sz}:1.0").split(','):
+        size, fraction = level.split(':')
+        schedule.append((min(int(size), im_sz), float(fraction)))
+    if schedule[-1][0] != im_sz:
+        schedule.append((im_sz, 0.0))
+
+    total_fraction = sum(fraction for _, fraction in schedule) or 1.0
+    levels = []
+    end_epoch = 0
+    for size, fraction in schedule[:-1]:
+        end_epoch = min(end_epoch + round(epochs * fraction / total_fraction), epochs)
+        levels.append((size, end_epoch))
+    levels.append((im_sz, epochs))
+    return levels
+
+
 def create_grid(scale):
     grid = np.mgrid[0:scale, 0:scale] / (scale - 1) * 2 - 1
     grid = np.swapaxes(grid, 0, 2)
@@ -52,6 +128,21 @@ def create_grid(scale):
 
 
 def produce_warp_maps(origins, targets, progress_signal: pyqtSignal(int)):
+    epochs = int(os.getenv("TRAIN_EPOCHS"))
+
+    # the same pair of images trained for the same number of epochs is not trained again
+    cache = get_warp_map_cache()
+    plateau_window = int(os.getenv("MORPH_PLATEAU_WINDOW", "20"))
+    plateau_tolerance = float(os.getenv("MORPH_PLATEAU_TOLERANCE", "0.001"))
+    pyramid_levels = get_pyramid_levels(epochs)
+    cache_key = WarpMapCache.make_key(origins, targets, dict(get_warp_parameters(), plateau_window=plateau_window,
+                                                             plateau_tolerance=plateau_tolerance,
+                                                             pyramid=os.getenv("MORPH_PYRAMID")))
+    cached_preds = cache.get(cache_key, epochs)
+    if cached_preds is not None:
+        progress_signal.emit(int(100))
+        return tf.image.resize(cached_preds, [im_sz, im_sz])
+
     class MyModel(tf.keras.Model):
         def __init__(self):
             super(MyModel, self).__init__()
@@ -77,19 +168,30 @@ def produce_warp_maps(origins, targets, progress_signal: pyqtSignal(int)):
 
     train_loss = tf.keras.metrics.Mean(name='train_loss')
 
+    # training with more epochs continues from a shorter cached training of the same pair
+    checkpoint = tf.train.Checkpoint(model=model, optimizer=optimizer)
+    start_epoch = 0
+    cached_checkpoint = cache.find_checkpoint(cache_key, epochs)
+    if cached_checkpoint is not None:
+        start_epoch, checkpoint_prefix = cached_checkpoint
+        checkpoint.read(checkpoint_prefix).expect_partial()
+        # the cached training already ended with the refinement in full resolution, going back to the coarse
+        # levels of the pyramid would undo it, so the remaining epochs stay in full resolution
+        pyramid_levels = [(im_sz, epochs)]
+
     @tf.function
-    def train_step(maps, origins, targets):
+    def train_step(maps, origins, targets, size):
         with tf.GradientTape() as tape:
             preds = model(maps)
-            preds = tf.image.resize(preds, [im_sz, im_sz])
+            preds = tf.image.resize(preds, [size, size])
 
             # a = tf.random.uniform([maps.shape[0]])
             # res_targets, res_origins = warp(origins, targets, preds[...,:8] * a, preds[...,8:] * (1 - a))
-            res_targets_, res_origins_ = warp(origins, targets, preds[..., :8], preds[..., 8:])
+            res_targets_, res_origins_ = warp(origins, targets, preds[..., :8], preds[..., 8:], size)
 
             # warp maps consistency checker
-            res_map = tfa.image.dense_image_warp(maps, preds[:, :, :, 6:8] * im_sz * warp_scale)
-            res_map = tfa.image.dense_image_warp(res_map, preds[:, :, :, 14:16] * im_sz * warp_scale)
+            res_map = tfa.image.dense_image_warp(maps, preds[:, :, :, 6:8] * size * warp_scale)
+            res_map = tfa.image.dense_image_warp(res_map, preds[:, :, :, 14:16] * size * warp_scale)
 
             loss = loss_object(maps, res_map) * 1 + loss_object(res_targets_, targets) * 0.3 + loss_object(res_origins_,
                                                                                                            origins) * 0.3
@@ -98,51 +200,198 @@ def produce_warp_maps(origins, targets, progress_signal: pyqtSignal(int)):
         optimizer.apply_gradients(zip(gradients, model.trainable_variables))
 
         train_loss(loss)
-
-    maps = create_grid(im_sz)
-    maps = np.concatenate((maps, origins * 0.1, targets * 0.1), axis=-1).astype(np.float32)
-
-    for i in range(int(os.getenv("TRAIN_EPOCHS"))):
-        epoch = i + 1
-        train_step(maps, origins, targets)
-
-        progress_signal.emit(int(i * 100 / int(os.getenv("TRAIN_EPOCHS"))))
-
-        if (epoch < 100 and epoch % 10 == 0) or \
-                (epoch < 1000 and epoch % 100 == 0) or \
-                (epoch % 1000 == 0):
-            preds = model(maps, training=False)[:1]
-            preds = tf.image.resize(preds, [im_sz, im_sz])
+        return loss
+
+    def create_level(size: int):
+        if size == im_sz:
+            level_origins, level_targets = origins, targets
+        else:
+            level_origins = cv2.resize(origins[0], (size, size), interpolation=cv2.INTER_AREA)[np.newaxis]
+            level_targets = cv2.resize(targets[0], (size, size), interpolation=cv2.INTER_AREA)[np.newaxis]
+        level_maps = np.concatenate((create_grid(size), level_origins * 0.1, level_targets * 0.1), axis=-1)
+        return level_maps.astype(np.float32), level_origins, level_targets
+
+    # the same model is trained coarse-to-fine, most epochs warp downscaled images and only the last ones refine
+    # the maps in full resolution. A level ends early when its loss stops improving, progress is reported against
+    # the plateau of the loss in full resolution or the epoch budget, whichever is closer. Losses of different
+    # resolutions are not comparable, so every level has its own monitor with a window short enough to detect
+    # a plateau within the first half of the level
+    epoch = start_epoch
+    for size, end_epoch in pyramid_levels:
+        if epoch >= end_epoch:
+            continue
+
+        level_maps, level_origins, level_targets = create_level(size)
+        monitor = ConvergenceMonitor(min(plateau_window, (end_epoch - epoch) // 4), plateau_tolerance)
+        while epoch < end_epoch:
+            loss = train_step(level_maps, level_origins, level_targets, size)
+            converged = monitor.update(float(loss))
+            epoch += 1
+
+            progress_signal.emit(int(max(epoch / epochs, monitor.progress if size == im_sz else 0.0) * 100))
+            if converged:
+                logging.getLogger().info(f'Training at {size} pixels converged after {epoch} epochs')
+                epoch = end_epoch
+                break
+
+    maps = create_level(im_sz)[0]
+
+    # maps are cached in the resolution of the model, they are resized the same way when they are used
+    preds = model(maps, training=False)[:1]
+    cache.put(cache_key, epochs, preds.numpy(), checkpoint)
+    preds = tf.image.resize(preds, [im_sz, im_sz])
 
     progress_signal.emit(int(100))
 
     return preds
 
 
-def generate_frames(origins, targets, preds, progress_signal: pyqtSignal(int), steps):
-    # apply maps
-    org_strength = tf.reshape(tf.range(steps, dtype=tf.float32), [steps, 1, 1, 1]) / (steps - 1)
-    trg_strength = tf.reverse(org_strength, axis=[0])
-
-    frames = []
-    for i in tqdm(range(steps)):
-        preds_org = preds * org_strength[i]
-        preds_trg = preds * trg_strength[i]
-
-        res_targets, res_origins = warp(origins, targets, preds_org[..., :8], preds_trg[..., 8:])
+class MorphFrameProvider:
+    """Frames between the source and the target image synthesized on demand, only the trained warp maps and both
+    images are kept, so memory does not grow with the number of steps. Frames around a requested position are
+    warped together in one call of warp() with MORPH_BATCH_SIZE frames, and MORPH_FRAME_CACHE recently used frames
+    are kept. Rendering requested by get_nearest_frame() runs in a background thread, only the latest request is
+    rendered, so a quickly moved slider does not queue up frames it already left"""
+
+    def __init__(self, origins, targets, preds, steps: int, frame_ready_signal: pyqtSignal(int) = None):
+        """
+        :param origins: preprocessed source image of shape (1, im_sz, im_sz, 3)
+        :param targets: preprocessed target image of shape (1, im_sz, im_sz, 3)
+        :param preds: warp maps returned by produce_warp_maps()
+        :param steps: number of frames including the source and the target image
+        :param frame_ready_signal: signal emitted with the position of every frame rendered in the background,
+        it can be set later as the frame_ready_signal attribute
+        """
+        self.origins = tf.convert_to_tensor(origins)
+        self.targets = tf.convert_to_tensor(targets)
+        self.preds = tf.convert_to_tensor(preds)
+        self.steps = steps
+        self.frame_ready_signal = frame_ready_signal
+        self.batch_size = min(max(int(os.getenv("MORPH_BATCH_SIZE", "4")), 1), steps)
+        self.max_frames = max(int(os.getenv("MORPH_FRAME_CACHE", "8")), self.batch_size)
+
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self._requested_position = None
+        self._request_condition = threading.Condition()
+        self._render_thread = None
+        self._closed = False
+
+    def __len__(self):
+        return self.steps
+
+    def get_frame(self, position: int):
+        """Return the frame at the position, frames around it are rendered in the calling thread if it is not cached
+        :param position: index of the frame between 0 (source image) and steps - 1 (target image)
+        :return: uint8 numpy array of shape (im_sz, im_sz, rgb=3)"""
+        self._check_position(position)
+
+        frame = self._get_cached_frame(position)
+        if frame is None:
+            self._render_around(position)
+            frame = self._get_cached_frame(position)
+        return frame
+
+    def get_nearest_frame(self, position: int) -> tuple:
+        """Return the cached frame closest to the position without waiting, frames around the position are rendered
+        in the background and frame_ready_signal is emitted for each of them
+        :param position: index of the frame between 0 (source image) and steps - 1 (target image)
+        :return: tuple of the position of the returned frame and the frame, the exact frame is returned if it is
+        cached, the frame is rendered in the calling thread only if no frame is cached at all"""
+        self._check_position(position)
+        self._request_rendering(position)
+
+        with self._lock:
+            if self._frames:
+                nearest_position = min(self._frames, key=lambda cached: abs(cached - position))
+                self._frames.move_to_end(nearest_position)
+                return nearest_position, self._frames[nearest_position]
+
+        return position, self.get_frame(position)
+
+    def close(self):
+        """Stop rendering in the background and drop cached frames"""
+        with self._request_condition:
+            self._closed = True
+            self._request_condition.notify_all()
+        with self._lock:
+            self._frames.clear()
+
+    def _check_position(self, position: int):
+        if not 0 <= position < self.steps:
+            raise IndexError(f'Frame position must be between <0, {self.steps - 1}>')
+
+    def _get_cached_frame(self, position: int):
+        with self._lock:
+            frame = self._frames.get(position)
+            if frame is not None:
+                self._frames.move_to_end(position)
+            return frame
+
+    def _request_rendering(self, position: int):
+        with self._request_condition:
+            if self._closed:
+                return
+            self._requested_position = position
+            if self._render_thread is None:
+                self._render_thread = threading.Thread(target=self._render_requests, daemon=True)
+                self._render_thread.start()
+            self._request_condition.notify_all()
+
+    def _render_requests(self):
+        while True:
+            with self._request_condition:
+                while self._requested_position is None and not self._closed:
+                    self._request_condition.wait()
+                if self._closed:
+                    return
+                position, self._requested_position = self._requested_position, None
+
+            for rendered_position in self._render_around(position):
+                if self.frame_ready_signal is not None and not self._closed:
+                    self.frame_ready_signal.emit(rendered_position)
+
+    def _render_around(self, position: int) -> list:
+        """Render the position and the closest positions around it which are not cached in a single batch
+        :return: rendered positions"""
+        neighbours = sorted(range(self.steps), key=lambda neighbour: (abs(neighbour - position), neighbour))
+        with self._lock:
+            positions = [neighbour for neighbour in neighbours if neighbour not in self._frames][:self.batch_size]
+        if not positions:
+            return []
+
+        frames = self._synthesize(positions)
+        with self._lock:
+            if self._closed:
+                return []
+            for rendered_position, frame in zip(positions, frames):
+                self._frames[rendered_position] = frame
+                self._frames.move_to_end(rendered_position)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+        return positions
+
+    def _synthesize(self, positions: list) -> list:
+        # the batch is padded to batch_size, so warp() is traced only once
+        indexes = positions + [positions[-1]] * (self.batch_size - len(positions))
+        org_strength = tf.reshape(tf.constant(indexes, dtype=tf.float32), [self.batch_size, 1, 1, 1])
+        org_strength = org_strength / (self.steps - 1)
+        trg_strength = 1 - org_strength
+
+        preds_org = self.preds * org_strength
+        preds_trg = self.preds * trg_strength
+
+        res_targets, res_origins = warp(tf.repeat(self.origins, self.batch_size, axis=0),
+                                        tf.repeat(self.targets, self.batch_size, axis=0),
+                                        preds_org[..., :8], preds_trg[..., 8:], im_sz)
         res_targets = tf.clip_by_value(res_targets, -1, 1)
         res_origins = tf.clip_by_value(res_origins, -1, 1)
 
-        results = res_targets * trg_strength[i] + res_origins * org_strength[i]
-        res_numpy = results.numpy()
-
-        img = ((res_numpy[0] + 1) * 127.5).astype(np.uint8)
-        frames.append(img)
-        progress_signal.emit(int(i * 100 / steps))
-
-    progress_signal.emit(int(100))
-
-    return frames
+        results = res_targets * trg_strength + res_origins * org_strength
+        frames = list(((results[:len(positions)].numpy() + 1) * 127.5).astype(np.uint8))
+        for frame in frames:
+            frame.flags.writeable = False
+        return frames
 
 
 def crop_different_dims_pictures(pic_a, pic_b):
@@ -199,6 +448,9 @@ def morphing_handler(
     predictions, origins, targets = training(src_path_1, src_path_2, training_signal)
     steps = 50
 
-    frames = generate_frames(origins, targets, predictions, morphing_signal, steps)  # generate frames between source and target images
+    # frames between source and target images are synthesized when the slider asks for them
+    provider = MorphFrameProvider(origins, targets, predictions, steps)
+    provider.get_frame(0)
+    morphing_signal.emit(int(100))
 
-    return frames
+    return provider
@@ -1,58 +1,80 @@
-import tensorflow as tf
 import cv2 as cv
-import urllib
-import requests
+import numpy as np
+
+from logic.image_cache import get_image_cache
 
 def load_img(path_to_img: str):
-    """ Function to load an image from a file, and add a batch dimension
+    """ Function to load an image from a file, and add a batch dimension, the decoded image is cached
     :param path_to_img
-    :return image with added batch dimension:
+    :return image with added batch dimension as float32 numpy array with values between 0.0 and 1.0:
     """
-    img = tf.io.read_file(path_to_img)
-    img = tf.io.decode_image(img, channels=3)
-    img = tf.image.convert_image_dtype(img, tf.float32)
-    img = img[tf.newaxis, :]
-
-    return img
+    return convert_rgb_image_to_batch(get_image_cache().get_array(path_to_img))
 
 
 def load_img_from_url(url: str):
-    """ Function to load an image from an url, and add a batch dimension
+    """ Function to load an image from an url, and add a batch dimension, the image is downloaded only if it
+        is not cached, e.g. after it was shown in a preview
         :param url
-        :return image with added batch dimension:
+        :return image with added batch dimension as float32 numpy array with values between 0.0 and 1.0:
         """
-    img = requests.get(url).content
-    img = tf.io.decode_image(img, channels=3)
-    img = tf.image.convert_image_dtype(img, tf.float32)
-    img = img[tf.newaxis, :]
+    return convert_rgb_image_to_batch(get_image_cache().get_array(url))
 
-    return img
 
+def convert_rgb_image_to_batch(image):
+    """Convert uint8 RGB image to float32 array with batch dimension and values between 0.0 and 1.0"""
+    out = np.empty((1,) + image.shape, dtype=np.float32)
+    np.multiply(image, np.float32(1 / 255), out=out[0])
+    return out
 
-def preprocess_image(image, target_dim: int):
+
+def preprocess_image(image, target_dim: int, out=None):
     """ Function to pre-process image by resizing and central cropping it
-    :param image: image as a tensor with batch dimension
+    :param image: image as a tensor or numpy array with batch dimension and values between 0.0 and 1.0
     :param target_dim: 256 for style image and 384 for content image
+    :param out: optional float32 array of shape (batch_size, target_dim, target_dim, 3) to write the result to
+    :return: float32 numpy array of shape (batch_size, target_dim, target_dim, 3)
     """
-    # Resize the image so that the shorter dimension becomes target dimension.
-    shape = tf.cast(tf.shape(image)[1:-1], tf.float32)
-    short_dim = min(shape)
-    scale = target_dim / short_dim
-    new_shape = tf.cast(shape * scale, tf.int32)
-    image = tf.image.resize(image, new_shape)
+    images = np.asarray(image, dtype=np.float32)
+    if out is None:
+        out = np.empty((images.shape[0], target_dim, target_dim, images.shape[-1]), dtype=np.float32)
+
+    for i, single_image in enumerate(images):
+        resize_and_crop_opencv_image(single_image, target_dim, out[i])
+
+    return out
+
+
+def convert_opencv_image_to_tensor(image, out=None):
+    """Convert loaded opencv image to array with batch dimension and RGB values between 0.0 and 1.0
+    :param image: opencv image in with BGR color coding
+    :param out: optional float32 array of shape (1, height, width, 3) to write the result to
+    :return: float32 numpy array of shape (1, height, width, 3)"""
+    if out is None:
+        out = np.empty((1,) + image.shape, dtype=np.float32)
 
-    # Central crop the image.
-    image = tf.image.resize_with_crop_or_pad(image, target_dim, target_dim)
+    # channels are swapped through a reversed view, so the only pass over the image is the conversion to float32
+    np.multiply(image[..., ::-1], np.float32(1 / 255), out=out[0])
+    return out
 
-    return image
 
+def resize_and_crop_opencv_image(image, target_dim: int, out=None):
+    """Resize opencv image so that the shorter dimension becomes target dimension and central crop it,
+    the result covers the same part of the image as preprocess_image(). Only the region which survives the crop
+    is resampled, straight into the result, so pixels which would be cropped away are never resized
+    :param image: opencv image
+    :param target_dim: size of the result square image
+    :param out: optional array of shape (target_dim, target_dim, channels) and dtype of image to write the result to
+    :return: the resized and cropped image"""
+    height, width = image.shape[:2]
+    scale = target_dim / min(height, width)
+    new_height, new_width = max(int(height * scale), target_dim), max(int(width * scale), target_dim)
+    top = (new_height - target_dim) // 2
+    left = (new_width - target_dim) // 2
 
-def convert_opencv_image_to_tensor(image):
-    """Convert loaded opencv image to tensor with batch dimension and RGB values between 0.0 and 1.0
-    :param image: opencv image in with BGR color coding"""
-    image = cv.cvtColor(image, cv.COLOR_BGR2RGB)
-    image = tf.convert_to_tensor(image, dtype=tf.uint8)
-    image = tf.image.convert_image_dtype(image, tf.float32)
-    image = image[tf.newaxis, :]
-    return image
+    # map pixels of the result to the source image with half-pixel centers, the same sampling as cv.resize
+    scale_x, scale_y = new_width / width, new_height / height
+    inverse_map = np.array([[1 / scale_x, 0, (left + 0.5) / scale_x - 0.5],
+                            [0, 1 / scale_y, (top + 0.5) / scale_y - 0.5]], dtype=np.float64)
 
+    return cv.warpAffine(image, inverse_map, (target_dim, target_dim), dst=out,
+                         flags=cv.INTER_LINEAR | cv.WARP_INVERSE_MAP, borderMode=cv.BORDER_REPLICATE)
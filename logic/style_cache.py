@@ -0,0 +1,119 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+class StyleBottleneckCache:
+    """Least recently used cache of style bottlenecks kept in memory and on disk, entries are addressed by
+    the content of the preprocessed style image and the model used to predict them, so they are shared between
+    image and video stylization and between sessions of the application"""
+
+    def __init__(self, directory: str, max_memory_entries: int, max_disk_entries: int):
+        """
+        :param directory: directory where bottlenecks are stored as .npy files
+        :param max_memory_entries: how many bottlenecks are kept in memory, 0 disables the memory cache
+        :param max_disk_entries: how many bottlenecks are kept on disk, 0 disables the disk cache
+        """
+        self.directory = Path(directory)
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._memory_entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.max_disk_entries > 0:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(preprocessed_style_image, model_path: str) -> str:
+        """Create cache key from a content hash of the style image, the model and the target dimension
+        :param preprocessed_style_image: image as a tensor of shape, e.g. (batch_size=1, width=256, height=256, rgb=3)
+        :param model_path: path to the style predict model
+        :return: hex digest identifying the bottleneck"""
+        image = np.ascontiguousarray(preprocessed_style_image, dtype=np.float32)
+
+        digest = hashlib.sha256()
+        digest.update(image.tobytes())
+        digest.update(str(image.shape).encode())
+        digest.update(os.path.abspath(model_path).encode())
+        digest.update(str(os.path.getsize(model_path)).encode())
+
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """Return cached bottleneck or None if it is not cached"""
+        with self._lock:
+            if key in self._memory_entries:
+                self._memory_entries.move_to_end(key)
+                return self._memory_entries[key]
+
+        if self.max_disk_entries <= 0:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            bottleneck = np.load(path)
+            os.utime(path)  # mark the entry as recently used
+        except (OSError, ValueError):
+            return None
+
+        self._put_in_memory(key, bottleneck)
+        return bottleneck
+
+    def put(self, key: str, bottleneck):
+        """Store bottleneck in memory and on disk, evicting least recently used entries above the limits"""
+        bottleneck = np.asarray(bottleneck, dtype=np.float32)
+        self._put_in_memory(key, bottleneck)
+
+        if self.max_disk_entries <= 0:
+            return
+
+        try:
+            temporary_path = self._entry_path(key).with_suffix('.tmp.npy')
+            np.save(temporary_path, bottleneck)
+            os.replace(temporary_path, self._entry_path(key))
+        except OSError as error:
+            logging.getLogger().warning(f'Could not save style bottleneck to cache: {error}')
+            return
+
+        self._evict_from_disk()
+
+    def clear(self):
+        """Remove all cached bottlenecks"""
+        with self._lock:
+            self._memory_entries.clear()
+
+        if self.directory.exists():
+            for path in self.directory.glob('*.npy'):
+                path.unlink(missing_ok=True)
+
+    def _put_in_memory(self, key: str, bottleneck):
+        if self.max_memory_entries <= 0:
+            return
+
+        with self._lock:
+            self._memory_entries[key] = bottleneck
+            self._memory_entries.move_to_end(key)
+            while len(self._memory_entries) > self.max_memory_entries:
+                self._memory_entries.popitem(last=False)
+
+    def _evict_from_disk(self):
+        entries = [entry for entry in os.scandir(self.directory)
+                   if entry.is_file() and entry.name.endswith('.npy') and not entry.name.endswith('.tmp.npy')]
+        if len(entries) <= self.max_disk_entries:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f'{key}.npy'
@@ -1,14 +1,30 @@
+import logging
+import multiprocessing
 import os
+import queue
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-import tensorflow as tf
 import cv2 as cv
+import numpy as np
 
 from enum import Enum
 
 from PyQt6.QtCore import pyqtSignal
 
-from logic.preprocessing import preprocess_image, load_img, convert_opencv_image_to_tensor
+from logic.frame_interpolation import InterpolationMode, KeyframeSelector, DuplicateFrameCache, \
+    compute_frame_signature, compute_perceptual_hash, interpolate_frames
+from logic.interpreter_pool import InterpreterPool
+from logic.model_registry import get_model_registry
+from logic.preprocessing import preprocess_image, load_img, convert_opencv_image_to_tensor, \
+    resize_and_crop_opencv_image
+from logic.style_cache import StyleBottleneckCache
+from logic.tiling import create_feather_window, get_tile_positions
+from logic.upsampling import GuidedUpsampler
+from logic.video_jobs import VideoStylizationJob
+from logic.video_pipeline import FrameBufferPool, FramePipeline, FrameRecord, VideoStatistics
 
 
 class StyleTransfer:
@@ -26,177 +42,825 @@ class StyleTransfer:
     active_style_predict_model_path = None
     active_style_transform_model_path = None
 
+    interpreter_pool = InterpreterPool()
+    _models_lock = threading.Lock()
+
+    CONTENT_IMAGE_SIZE = 384
+
+    PIPELINE_QUEUE_SIZE = 8
+    RESULT_VIDEO_CODEC = 'DIVX'
+    SEGMENT_VIDEO_CODEC = 'FFV1'
+    MAX_PENDING_FRAMES = 64
+    last_video_statistics = None
+
+    STYLE_CACHE_DIRECTORY = 'assets/cache/style-bottlenecks'
+    style_bottleneck_cache = None
+
     @classmethod
     def set_mode(cls, mode: StyleTransferMode):
         """sets chosen mode as active which means that models corresponding to that mode will be used for stylizing
         :param mode: enum defining mode"""
+        cls.active_style_predict_model_path, cls.active_style_transform_model_path = cls.get_model_paths(mode)
+
+    @classmethod
+    def get_model_paths(cls, mode: StyleTransferMode) -> tuple:
+        """Return models of the mode without making them active. A job takes them when it starts and passes them
+        on, so a mode set by another menu does not change models of a running job
+        :param mode: enum defining mode
+        :return: tuple of paths to style predict and style transform models"""
+        cls.ensure_models_loaded()
         match mode:
             case cls.StyleTransferMode.IMAGE:
-                cls.active_style_predict_model_path = cls.style_predict_image_model_path
-                cls.active_style_transform_model_path = cls.style_transform_image_model_path
-            case cls.StyleTransferMode.VIDEO:
-                cls.active_style_predict_model_path = cls.style_predict_video_model_path
-                cls.active_style_transform_model_path = cls.style_transform_video_model_path
+                return cls.style_predict_image_model_path, cls.style_transform_image_model_path
             case _:
-                cls.active_style_predict_model_path = cls.style_predict_video_model_path
-                cls.active_style_transform_model_path = cls.style_transform_video_model_path
+                return cls.style_predict_video_model_path, cls.style_transform_video_model_path
+
+    @classmethod
+    def resolve_model_paths(cls, model_paths: tuple = None) -> tuple:
+        """:return: model_paths or paths to active models if it is None"""
+        if model_paths is not None:
+            return model_paths
+        return cls.active_style_predict_model_path, cls.active_style_transform_model_path
 
     @classmethod
     def load_models(cls):
-        """should be called at the start of the program, loads all models used for stylization"""
-        # models for images
-        cls.style_predict_image_model_path = tf.keras.utils.get_file('style_predict.tflite',
-                                                                     'https://tfhub.dev/sayakpaul/lite-model/arbitrary-image-stylization-inceptionv3/int8/predict/1?lite-format=tflite')
+        """loads all models used for stylization from the local model registry, see ensure_models_loaded()"""
+        registry = get_model_registry()
 
-        cls.style_transform_image_model_path = tf.keras.utils.get_file('style_transform.tflite',
-                                                                       'https://tfhub.dev/sayakpaul/lite-model/arbitrary-image-stylization-inceptionv3/int8/transfer/1?lite-format=tflite')
+        # all models are looked up before any is set, so a missing model leaves none of them loaded and
+        # ensure_models_loaded() tries again
+        style_predict_image_model_path = registry.get_model_path('style_predict_image')
+        style_transform_image_model_path = registry.get_model_path('style_transform_image')
+        style_predict_video_model_path = registry.get_model_path('style_predict_video')
+        style_transform_video_model_path = registry.get_model_path('style_transform_video')
 
-        # models for video
-        cls.style_predict_video_model_path = tf.keras.utils.get_file('style_predict.tflite',
-                                                                     'https://tfhub.dev/google/lite-model/magenta/arbitrary-image-stylization-v1-256/int8/prediction/1?lite-format=tflite')
+        # models for images
+        cls.style_predict_image_model_path = style_predict_image_model_path
+        cls.style_transform_image_model_path = style_transform_image_model_path
 
-        cls.style_transform_video_model_path = tf.keras.utils.get_file('style_transform.tflite',
-                                                                       'https://tfhub.dev/google/lite-model/magenta/arbitrary-image-stylization-v1-256/int8/transfer/1?lite-format=tflite')
+        # models for video
+        cls.style_predict_video_model_path = style_predict_video_model_path
+        cls.style_transform_video_model_path = style_transform_video_model_path
 
         # set active models
         cls.active_style_predict_model_path = cls.style_predict_video_model_path
         cls.active_style_transform_model_path = cls.style_transform_video_model_path
 
     @classmethod
-    def run_style_predict(cls, preprocessed_style_image):
+    def ensure_models_loaded(cls):
+        """Load models if they are not loaded yet, it is safe to call from any thread"""
+        with cls._models_lock:
+            if cls.style_predict_image_model_path is None:
+                cls.load_models()
+
+    @classmethod
+    def warm_up(cls):
+        """Load models and create interpreters of single image stylization for both modes, so the first
+        stylization does not wait for them, meant to run in a background thread at the start of the program"""
+        cls.ensure_models_loaded()
+
+        for predict_model_path, transform_model_path in \
+                ((cls.style_predict_image_model_path, cls.style_transform_image_model_path),
+                 (cls.style_predict_video_model_path, cls.style_transform_video_model_path)):
+            style_image = np.zeros((1, 256, 256, 3), dtype=np.float32)
+            with cls.interpreter_pool.acquire(predict_model_path, [style_image.shape]) as interpreter:
+                interpreter.set_tensor(interpreter.get_input_details()[0]["index"], style_image)
+                interpreter.invoke()
+                style_bottleneck = interpreter.get_tensor(interpreter.get_output_details()[0]["index"])
+
+            content_image = np.zeros((1, cls.CONTENT_IMAGE_SIZE, cls.CONTENT_IMAGE_SIZE, 3), dtype=np.float32)
+            with cls.interpreter_pool.acquire(transform_model_path,
+                                              [content_image.shape, style_bottleneck.shape]) as interpreter:
+                input_details = interpreter.get_input_details()
+                interpreter.set_tensor(input_details[0]["index"], content_image)
+                interpreter.set_tensor(input_details[1]["index"], style_bottleneck)
+                interpreter.invoke()
+
+    @classmethod
+    def run_style_predict(cls, preprocessed_style_image, model_paths: tuple = None):
         """Function to run style prediction on preprocessed style image
         :param preprocessed_style_image: image as a tensor of shape, e.g. (batch_size=1, width=256, height=256, rgb=3)
+        :param model_paths: paths to style predict and style transform models, active models if it is None
         :return: numpy array defining style of an image"""
-        interpreter = tf.lite.Interpreter(model_path=cls.active_style_predict_model_path)
+        with cls.interpreter_pool.acquire(cls.resolve_model_paths(model_paths)[0],
+                                          [preprocessed_style_image.shape]) as interpreter:
+            # Set model input.
+            input_details = interpreter.get_input_details()
+            interpreter.set_tensor(input_details[0]["index"], preprocessed_style_image)
 
-        # Set model input.
-        interpreter.allocate_tensors()
-        input_details = interpreter.get_input_details()
-        interpreter.set_tensor(input_details[0]["index"], preprocessed_style_image)
+            # Calculate style bottleneck, copy it out as the interpreter will be reused.
+            interpreter.invoke()
+            style_bottleneck = interpreter.get_tensor(interpreter.get_output_details()[0]["index"])
 
-        # Calculate style bottleneck.
-        interpreter.invoke()
-        style_bottleneck = interpreter.tensor(
-            interpreter.get_output_details()[0]["index"])()
+        return style_bottleneck
+
+    @classmethod
+    def get_style_bottleneck(cls, preprocessed_style_image, model_paths: tuple = None):
+        """Return style bottleneck of preprocessed style image, it is taken from the cache if the same image was
+        already used with the same model, otherwise style prediction is run and its result is cached
+        :param preprocessed_style_image: image as a tensor of shape, e.g. (batch_size=1, width=256, height=256, rgb=3)
+        :param model_paths: paths to style predict and style transform models, active models if it is None
+        :return: numpy array defining style of an image"""
+        if cls.style_bottleneck_cache is None:
+            cls.style_bottleneck_cache = StyleBottleneckCache(cls.STYLE_CACHE_DIRECTORY,
+                                                              int(os.getenv("STYLE_CACHE_MEMORY_ENTRIES", "32")),
+                                                              int(os.getenv("STYLE_CACHE_DISK_ENTRIES", "256")))
+
+        model_paths = cls.resolve_model_paths(model_paths)
+        key = StyleBottleneckCache.make_key(preprocessed_style_image, model_paths[0])
+        style_bottleneck = cls.style_bottleneck_cache.get(key)
+        if style_bottleneck is None:
+            style_bottleneck = cls.run_style_predict(preprocessed_style_image, model_paths)
+            cls.style_bottleneck_cache.put(key, style_bottleneck)
 
         return style_bottleneck
 
     @classmethod
-    def run_style_transform(cls, style_bottleneck, preprocessed_content_image):
+    def run_style_transform(cls, style_bottleneck, preprocessed_content_image, model_paths: tuple = None):
         """Run style transform on preprocessed style image
         :param style_bottleneck: numpy array defining style of an image
         :param preprocessed_content_image: image as a tensor of shape, e.g. (batch_size=1, width=384, height=384, rgb=3)
+        :param model_paths: paths to style predict and style transform models, active models if it is None
         :return: result image as numpy array of the same shape as preprocessed_content_image"""
-        interpreter = tf.lite.Interpreter(model_path=cls.active_style_transform_model_path)
-
-        # Set model input.
-        input_details = interpreter.get_input_details()
-        interpreter.allocate_tensors()
+        with cls.interpreter_pool.acquire(cls.resolve_model_paths(model_paths)[1],
+                                          [preprocessed_content_image.shape, style_bottleneck.shape]) as interpreter:
+            # Set model inputs.
+            input_details = interpreter.get_input_details()
+            interpreter.set_tensor(input_details[0]["index"], preprocessed_content_image)
+            interpreter.set_tensor(input_details[1]["index"], style_bottleneck)
+            interpreter.invoke()
 
-        # Set model inputs.
-        interpreter.set_tensor(input_details[0]["index"], preprocessed_content_image)
-        interpreter.set_tensor(input_details[1]["index"], style_bottleneck)
-        interpreter.invoke()
-
-        # Transform content image.
-        stylized_image = interpreter.tensor(
-            interpreter.get_output_details()[0]["index"]
-        )()
+            # Transform content image, copy it out as the interpreter will be reused.
+            stylized_image = interpreter.get_tensor(interpreter.get_output_details()[0]["index"])
 
         return stylized_image
 
     @staticmethod
-    def stylize_image(content_image, style_image, content_blending_ratio: float):
+    def stylize_image(content_image, style_image, content_blending_ratio: float, model_paths: tuple = None):
         """Use active models to stylize an image
         :param content_image: image as a tensor of shape (batch_size=1, width=384, height=384, rgb=3)
         :param style_image: image as a tensor of shape (batch_size=1, width=256, height=256, rgb=3)
         :param content_blending_ratio: how much style of the content image is considered (between 0.0 and 1.0)
+        :param model_paths: paths to style predict and style transform models, active models if it is None
         :return result image as numpy array in a shape (width=384, height=384, rgb=3):
         """
         # Calculate style bottleneck for the preprocessed style image.
-        style_bottleneck = StyleTransfer.run_style_predict(style_image)
-        style_bottleneck_content = StyleTransfer.run_style_predict(preprocess_image(content_image, 256))
-        style_bottleneck_blended = content_blending_ratio * style_bottleneck_content + (
-                1 - content_blending_ratio) * style_bottleneck
+        style_bottleneck = StyleTransfer.run_style_predict(style_image, model_paths)
 
-        # Stylize the content image using the style bottleneck.
-        result_image = StyleTransfer.run_style_transform(style_bottleneck_blended, content_image)[0]
+        return StyleTransfer.stylize_with_style_bottleneck(content_image, style_bottleneck, content_blending_ratio,
+                                                           model_paths)
 
-        return result_image
+    @staticmethod
+    def stylize_with_style_bottleneck(content_image, style_bottleneck, content_blending_ratio: float,
+                                      model_paths: tuple = None):
+        """Use active models to stylize an image with an already calculated style bottleneck
+        :param content_image: image as a tensor of shape (batch_size=1, width=384, height=384, rgb=3)
+        :param style_bottleneck: numpy array returned by run_style_predict() for the style image
+        :param content_blending_ratio: how much style of the content image is considered (between 0.0 and 1.0)
+        :param model_paths: paths to style predict and style transform models, active models if it is None
+        :return result image as numpy array in a shape (width=384, height=384, rgb=3):
+        """
+        return StyleTransfer.stylize_batch_with_style_bottleneck(content_image, style_bottleneck,
+                                                                 content_blending_ratio, model_paths)[0]
+
+    @staticmethod
+    def stylize_batch_with_style_bottleneck(content_images, style_bottleneck, content_blending_ratio: float,
+                                            model_paths: tuple = None):
+        """Use active models to stylize a batch of images with one invocation of each model
+        :param content_images: images as a tensor of shape (batch_size, width=384, height=384, rgb=3)
+        :param style_bottleneck: numpy array returned by run_style_predict() for the style image
+        :param content_blending_ratio: how much style of the content images is considered (between 0.0 and 1.0)
+        :param model_paths: paths to style predict and style transform models, active models if it is None
+        :return result images as numpy array in a shape (batch_size, width=384, height=384, rgb=3):
+        """
+        style_bottleneck_content = StyleTransfer.run_style_predict(preprocess_image(content_images, 256), model_paths)
+        style_bottleneck_blended = StyleTransfer.blend_style_bottlenecks(style_bottleneck, style_bottleneck_content,
+                                                                         content_blending_ratio)
+
+        # Stylize the content images using the style bottlenecks.
+        return StyleTransfer.run_style_transform(style_bottleneck_blended, content_images, model_paths)
+
+    @staticmethod
+    def blend_style_bottlenecks(style_bottleneck, style_bottleneck_content, content_blending_ratio: float):
+        """Blend style of the style image with style of the content image
+        :param style_bottleneck: numpy array defining style of the style image
+        :param style_bottleneck_content: numpy array defining style of the content image
+        :param content_blending_ratio: how much style of the content image is considered (between 0.0 and 1.0)
+        :return: blended style bottleneck as float32 numpy array"""
+        blended = content_blending_ratio * style_bottleneck_content + (1 - content_blending_ratio) * style_bottleneck
+        return np.asarray(blended, dtype=np.float32)
+
+    @classmethod
+    def stylize_image_tiled(cls, content_image, style_bottleneck, content_blending_ratio: float,
+                            progress_signal: pyqtSignal(int) = None, cancel_event: threading.Event = None,
+                            model_paths: tuple = None):
+        """Use active models to stylize an image in its full resolution, the image is split into overlapping tiles
+        which are stylized in batches by parallel interpreters with one shared style bottleneck and feather-blended
+        back together. Only TILE_WORKERS * 2 batches of tiles are in memory at the same time
+        :param content_image: image as a tensor of shape (batch_size=1, height, width, rgb=3)
+        :param style_bottleneck: numpy array returned by run_style_predict() for the style image
+        :param content_blending_ratio: how much style of the content image is considered (between 0.0 and 1.0)
+        :param progress_signal: signal to emit after every batch of tiles
+        :param cancel_event: event which stops stylization of further tiles with StylizationCancelled
+        :param model_paths: paths to style predict and style transform models, active models if it is None
+        :return result image as numpy array in a shape (height, width, rgb=3)
+        """
+        tile_size = cls.CONTENT_IMAGE_SIZE
+        overlap = min(int(os.getenv("TILE_OVERLAP", "64")), tile_size // 2)
+        batch_size = max(int(os.getenv("TILE_BATCH_SIZE", "4")), 1)
+        workers = max(int(os.getenv("TILE_WORKERS", "2")), 1)
+
+        image = np.asarray(content_image, dtype=np.float32)[0]
+        height, width = image.shape[:2]
+        if height < tile_size or width < tile_size:
+            image = cv.copyMakeBorder(image, 0, max(tile_size - height, 0), 0, max(tile_size - width, 0),
+                                      cv.BORDER_REFLECT)
+
+        # all tiles share the style of the whole content image
+        style_bottleneck_content = cls.run_style_predict(preprocess_image(content_image, 256), model_paths)
+        style_bottleneck_blended = cls.blend_style_bottlenecks(style_bottleneck, style_bottleneck_content,
+                                                               content_blending_ratio)
+        style_bottlenecks = np.repeat(style_bottleneck_blended, batch_size, axis=0)
+
+        positions = [(top, left)
+                     for top in get_tile_positions(image.shape[0], tile_size, overlap)
+                     for left in get_tile_positions(image.shape[1], tile_size, overlap)]
+        batches = [positions[i:i + batch_size] for i in range(0, len(positions), batch_size)]
+
+        window = create_feather_window(tile_size, overlap)
+        result_image = np.zeros(image.shape, dtype=np.float32)
+        weights = np.zeros(image.shape[:2] + (1,), dtype=np.float32)
+
+        def stylize_tiles(batch_positions: list):
+            tiles = np.stack([image[top:top + tile_size, left:left + tile_size] for top, left in batch_positions])
+            if len(batch_positions) < batch_size:
+                tiles = np.concatenate([tiles, np.repeat(tiles[-1:], batch_size - len(batch_positions), axis=0)])
+            return batch_positions, cls.run_style_transform(style_bottlenecks, tiles, model_paths)
+
+        def blend_tiles(batch_positions: list, stylized_tiles):
+            for (top, left), stylized_tile in zip(batch_positions, stylized_tiles):
+                result_image[top:top + tile_size, left:left + tile_size] += stylized_tile * window
+                weights[top:top + tile_size, left:left + tile_size] += window
+
+        blended_batches = 0
+
+        def blend_next_batch():
+            nonlocal blended_batches
+            blend_tiles(*in_flight.popleft().result())
+            blended_batches += 1
+            if progress_signal is not None:
+                progress_signal.emit(int(blended_batches * 100 / len(batches)))
+
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch_positions in batches:
+                if cancel_event is not None and cancel_event.is_set():
+                    for future in in_flight:
+                        future.cancel()
+                    raise StylizationCancelled()
+
+                in_flight.append(executor.submit(stylize_tiles, batch_positions))
+                if len(in_flight) >= workers * 2:
+                    blend_next_batch()
+
+            while in_flight:
+                blend_next_batch()
+
+        result_image /= np.maximum(weights, 1e-6)
+        return result_image[:height, :width]
 
     @staticmethod
     def stylize_video(content_video_path: str, style_image, content_blending_ratio: float,
-                      progress_signal: pyqtSignal(int)):
+                      progress_signal: pyqtSignal(int), model_paths: tuple = None):
         """Use active models to stylize a video
         :param content_video_path: path to video
         :param style_image: image as a tensor of shape (batch_size=1, width=256, height=256, rgb=3)
         :param content_blending_ratio: how much style of the content video is considered (between 0.0 and 1.0)
         :param progress_signal: signal to emit every frame
+        :param model_paths: paths to style predict and style transform models, active models if it is None
         :param interpolate: if to interpolate frames
         :return: path to result video
         """
         result_video_path = StyleTransfer.find_next_result_video_path()
+        model_paths = StyleTransfer.resolve_model_paths(model_paths)
+
         video_capture_object = cv.VideoCapture(content_video_path)
+        frame_counter = int(video_capture_object.get(cv.CAP_PROP_FRAME_COUNT))
+        video_capture_object.release()
+
+        # style image is the same for the whole video, so its bottleneck is calculated only once
+        style_bottleneck = StyleTransfer.get_style_bottleneck(style_image, model_paths)
+
+        # frames are written in segments, so a crashed or cancelled job can be resumed
+        style_hash = StyleBottleneckCache.make_key(style_image, model_paths[0])
+        job = VideoStylizationJob(content_video_path, style_hash, content_blending_ratio, frame_counter,
+                                  int(os.getenv("VIDEO_SEGMENT_FRAMES", "300")),
+                                  StyleTransfer.get_video_settings(model_paths))
+        # every shard needs a pending segment, segments of a short video are split for them
+        shards_count = max(int(os.getenv("VIDEO_SHARDS", "1")), 1)
+        if shards_count > 1:
+            job.split_pending_segments(shards_count, frame_counter)
+        pending_segments = job.pending_segments()
+        shards_count = min(shards_count, len(pending_segments))
+        statistics = VideoStatistics()
+
+        # a single segment is written in the codec of the result and becomes the result video, more segments are
+        # written losslessly, so joining them compresses frames only once
+        codec = StyleTransfer.RESULT_VIDEO_CODEC if len(job.segments) == 1 else StyleTransfer.SEGMENT_VIDEO_CODEC
+
+        if shards_count > 1:
+            statistics = StyleTransfer.stylize_video_in_shards(content_video_path, frame_counter, shards_count, job,
+                                                               style_bottleneck, content_blending_ratio, model_paths,
+                                                               codec, progress_signal)
+        else:
+            done_frames = frame_counter - sum(job.segment_frames_count(index, frame_counter)
+                                              for index in pending_segments)
+            for index in pending_segments:
+                segment_frames = job.segment_frames_count(index, frame_counter)
+                start_frame, end_frame = job.segments[index]
+                statistics.add(StyleTransfer.stylize_frame_range(
+                    content_video_path, start_frame, end_frame, job.partial_segment_path(index), style_bottleneck,
+                    content_blending_ratio, RangeProgressSignal(progress_signal, done_frames, segment_frames,
+                                                                frame_counter), model_paths, codec))
+                job.complete_segment(index)
+                done_frames += segment_frames
+
+        # the result video appears only when it is complete
+        if len(job.segments) == 1:
+            os.replace(job.segment_path(0), result_video_path)
+        else:
+            partial_result_video_path = f'{os.path.splitext(result_video_path)[0]}-partial.avi'
+            StyleTransfer.concatenate_videos(job.segment_paths(), partial_result_video_path)
+            os.replace(partial_result_video_path, result_video_path)
+        job.remove()
 
-        frame_size = (384, 384)
+        StyleTransfer.last_video_statistics = statistics
+        logging.getLogger().info(f'Video stylization finished: {statistics}, '
+                                 f'{statistics.skipped_frames()} frames skipped the models')
+        progress_signal.emit(100)
+
+        return result_video_path
+
+    @staticmethod
+    def get_video_settings(model_paths: tuple = None) -> dict:
+        """:param model_paths: paths to style predict and style transform models, active models if it is None
+        :return: settings which change the result of video stylization, used to identify video jobs"""
+        return {
+            'style_transform_model': StyleTransfer.resolve_model_paths(model_paths)[1],
+            'interpolation': os.getenv("INTERPOLATION"),
+            'interpolation_step': os.getenv("INTERPOLATION_STEP"),
+            'interpolation_mode': os.getenv("INTERPOLATION_MODE"),
+            'motion_threshold': os.getenv("MOTION_THRESHOLD"),
+            'scene_detection': os.getenv("SCENE_DETECTION"),
+            'content_change_threshold': os.getenv("CONTENT_CHANGE_THRESHOLD"),
+            'scene_cut_threshold': os.getenv("SCENE_CUT_THRESHOLD"),
+            'duplicate_detection': os.getenv("DUPLICATE_DETECTION"),
+            'duplicate_threshold': os.getenv("DUPLICATE_THRESHOLD"),
+            'keep_resolution': os.getenv("VIDEO_KEEP_RESOLUTION"),
+        }
+
+    @staticmethod
+    def stylize_frame_range(content_video_path: str, start_frame: int, end_frame, output_path: str,
+                            style_bottleneck, content_blending_ratio: float, progress_signal: pyqtSignal(int),
+                            model_paths: tuple = None, codec: str = RESULT_VIDEO_CODEC):
+        """Stylize frames from start_frame to end_frame (exclusive) of a video and write them to a new video
+        :param content_video_path: path to video
+        :param start_frame: index of the first stylized frame
+        :param end_frame: index after the last stylized frame or None to stylize frames to the end of the video
+        :param output_path: path to result video
+        :param style_bottleneck: numpy array returned by run_style_predict() for the style image
+        :param content_blending_ratio: how much style of the content video is considered (between 0.0 and 1.0)
+        :param progress_signal: signal to emit every stylized frame with progress of the range
+        :param model_paths: paths to style predict and style transform models, active models if it is None
+        :param codec: fourcc of the result video
+        :return: VideoStatistics of the range
+        """
+        video_capture_object = cv.VideoCapture(content_video_path)
+        if start_frame > 0:
+            video_capture_object.set(cv.CAP_PROP_POS_FRAMES, start_frame)
+
+        # with kept resolution frames are stylized whole at model resolution and upsampled back
+        keep_resolution = os.getenv("VIDEO_KEEP_RESOLUTION") == "TRUE"
+        source_frame_size = (int(video_capture_object.get(cv.CAP_PROP_FRAME_WIDTH)),
+                             int(video_capture_object.get(cv.CAP_PROP_FRAME_HEIGHT)))
+        model_frame_size = StyleTransfer.get_model_frame_size(source_frame_size, keep_resolution)
+        frame_size = source_frame_size if keep_resolution else model_frame_size
         frame_rate = video_capture_object.get(cv.CAP_PROP_FPS)
-        frame_counter = int(video_capture_object.get(cv.CAP_PROP_FRAME_COUNT))
-        out = cv.VideoWriter(result_video_path, cv.VideoWriter_fourcc(*'DIVX'), frame_rate, frame_size)
+        frames_count = None if end_frame is None else end_frame - start_frame
+        progress_frames_count = frames_count or int(video_capture_object.get(cv.CAP_PROP_FRAME_COUNT)) - start_frame
+        out = StyleTransfer.open_video_writer(output_path, codec, frame_rate, frame_size)
+
+        interpolation_step = int(os.getenv("INTERPOLATION_STEP")) if os.getenv("INTERPOLATION") == "TRUE" else 1
+        interpolation_mode = InterpolationMode(os.getenv("INTERPOLATION_MODE", "BLEND"))
+        keyframe_selector = KeyframeSelector(interpolation_mode, interpolation_step,
+                                             float(os.getenv("MOTION_THRESHOLD", "8.0")),
+                                             os.getenv("SCENE_DETECTION") == "TRUE",
+                                             float(os.getenv("CONTENT_CHANGE_THRESHOLD", "0.2")),
+                                             float(os.getenv("SCENE_CUT_THRESHOLD", "0.5")))
+        duplicate_cache = None
+        if os.getenv("DUPLICATE_DETECTION") == "TRUE":
+            duplicate_cache = DuplicateFrameCache(int(os.getenv("DUPLICATE_THRESHOLD", "2")),
+                                                  int(os.getenv("DUPLICATE_CACHE_SIZE", "16")))
+        batch_size = max(int(os.getenv("VIDEO_BATCH_SIZE", "1")), 1)
+        statistics = VideoStatistics()
+
+        # decoded and preprocessed frames are reused once they leave the pipeline
+        frame_pool = FrameBufferPool((source_frame_size[1], source_frame_size[0], 3), np.uint8)
+        content_pool = FrameBufferPool((model_frame_size[1], model_frame_size[0], 3), np.uint8)
+        # results of keyframes are shared with their duplicates, so they are reused only without duplicate detection
+        result_pool = None
+        if duplicate_cache is None:
+            result_pool = FrameBufferPool((model_frame_size[1], model_frame_size[0], 3), np.uint8)
+
+        # decoding, preprocessing, inference and encoding of frames overlap with each other
+        pipeline = FramePipeline(StyleTransfer.PIPELINE_QUEUE_SIZE)
+        pipeline.add_stage(lambda _: StyleTransfer.decode_frames(video_capture_object, frames_count, frame_pool))
+        pipeline.add_stage(lambda frames: StyleTransfer.preprocess_frames(frames, keyframe_selector,
+                                                                             duplicate_cache, statistics,
+                                                                             keep_resolution, model_frame_size,
+                                                                             frame_pool, content_pool))
+        pipeline.add_stage(lambda records: StyleTransfer.stylize_frames(records, style_bottleneck,
+                                                                        content_blending_ratio, batch_size,
+                                                                        content_pool, model_paths, result_pool))
+        pipeline.add_stage(lambda records: StyleTransfer.encode_frames(records, out, progress_frames_count,
+                                                                        progress_signal, interpolation_mode,
+                                                                        frame_pool, result_pool))
+
+        try:
+            pipeline.run()
+        finally:
+            video_capture_object.release()
+            out.release()
+
+        return statistics
 
+    @staticmethod
+    def stylize_video_in_shards(content_video_path: str, frame_counter: int, shards_count: int,
+                                job: VideoStylizationJob, style_bottleneck, content_blending_ratio: float,
+                                model_paths: tuple, codec: str, progress_signal: pyqtSignal(int)):
+        """Split pending segments of the job into contiguous shards and stylize each shard in a separate process
+        with its own interpreters, finished segments are recorded in the job manifest by this process
+        :param content_video_path: path to video
+        :param frame_counter: number of frames in the video
+        :param shards_count: number of processes
+        :param job: checkpoint of the stylization
+        :param style_bottleneck: numpy array returned by run_style_predict() for the style image
+        :param content_blending_ratio: how much style of the content video is considered (between 0.0 and 1.0)
+        :param model_paths: paths to style predict and style transform models
+        :param codec: fourcc of segment videos
+        :param progress_signal: signal to emit with progress merged from all processes
+        :return: VideoStatistics merged from all processes
+        """
+        pending_segments = job.pending_segments()
+        boundaries = [len(pending_segments) * i // shards_count for i in range(shards_count + 1)]
+        shards = [[(index, *job.segments[index], job.partial_segment_path(index))
+                   for index in pending_segments[start:end]]
+                  for start, end in zip(boundaries[:-1], boundaries[1:])]
+        context = multiprocessing.get_context('spawn')
+        progress_queue = context.Queue()
+
+        processes = [context.Process(target=stylize_video_shard,
+                                     args=(shard_index, content_video_path, shard, frame_counter, style_bottleneck,
+                                           content_blending_ratio, model_paths, codec, progress_queue))
+                     for shard_index, shard in enumerate(shards)]
+        finished_frames = frame_counter - sum(job.segment_frames_count(index, frame_counter)
+                                              for index in pending_segments)
+        shards_progress = [0] * shards_count
+        statistics = VideoStatistics()
+
+        def handle_message(shard_index: int, done_frames: int, completed_segment, segment_statistics):
+            nonlocal finished_frames
+            if completed_segment is not None:
+                job.complete_segment(completed_segment)
+                finished_frames += job.segment_frames_count(completed_segment, frame_counter)
+                statistics.add(VideoStatistics(**segment_statistics))
+            shards_progress[shard_index] = done_frames
+            progress_signal.emit(min(int((finished_frames + sum(shards_progress)) * 100 / frame_counter), 99))
+
+        try:
+            for process in processes:
+                process.start()
+
+            while any(process.is_alive() for process in processes) or not progress_queue.empty():
+                try:
+                    handle_message(*progress_queue.get(timeout=0.1))
+                except queue.Empty:
+                    continue
+        finally:
+            # shards do not outlive a failure of this process, e.g. of saving the manifest
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                if process.pid is not None:
+                    process.join()
+
+        failed_shards = [i for i, process in enumerate(processes) if process.exitcode != 0]
+        if failed_shards:
+            raise RuntimeError(f'Stylization of video shards {failed_shards} failed')
+
+        return statistics
+
+    @staticmethod
+    def concatenate_videos(video_paths: list, output_path: str):
+        """Write frames of all videos in order into a single video, videos must have the same size and frame rate
+        :param video_paths: paths to joined videos
+        :param output_path: path to result video"""
+        out = None
+        try:
+            for video_path in video_paths:
+                video_capture_object = cv.VideoCapture(video_path)
+                if out is None:
+                    frame_size = (int(video_capture_object.get(cv.CAP_PROP_FRAME_WIDTH)),
+                                  int(video_capture_object.get(cv.CAP_PROP_FRAME_HEIGHT)))
+                    out = StyleTransfer.open_video_writer(output_path, StyleTransfer.RESULT_VIDEO_CODEC,
+                                                          video_capture_object.get(cv.CAP_PROP_FPS), frame_size)
+
+                for image in StyleTransfer.decode_frames(video_capture_object):
+                    out.write(image)
+                video_capture_object.release()
+        finally:
+            if out is not None:
+                out.release()
+
+    @staticmethod
+    def open_video_writer(output_path: str, codec: str, frame_rate: float, frame_size: tuple) -> cv.VideoWriter:
+        """Open a video writer, the result codec is used if OpenCV cannot write the video with the given codec
+        :param output_path: path to the video
+        :param codec: fourcc of the video, e.g. lossless FFV1 for intermediate segments
+        :param frame_rate: frames per second
+        :param frame_size: tuple of width and height of frames
+        :return: opened writer"""
+        out = cv.VideoWriter(output_path, cv.VideoWriter_fourcc(*codec), frame_rate, frame_size)
+        if not out.isOpened() and codec != StyleTransfer.RESULT_VIDEO_CODEC:
+            logging.getLogger().warning(f'Codec {codec} is not available, writing {output_path} with '
+                                        f'{StyleTransfer.RESULT_VIDEO_CODEC}')
+            out = cv.VideoWriter(output_path, cv.VideoWriter_fourcc(*StyleTransfer.RESULT_VIDEO_CODEC), frame_rate,
+                                 frame_size)
+        return out
+
+    @staticmethod
+    def stylize_frame_batch(content_frames: list, style_bottleneck, content_blending_ratio: float, batch_size: int,
+                            model_paths: tuple = None, result_pool: FrameBufferPool = None):
+        """Stylize video frames together, a smaller batch is padded to batch_size, so the same interpreters are
+        reused for the last batch of a video. Frames are converted straight into the input tensor of the style
+        transform interpreter and results are read from its output tensor without intermediate batches
+        :param content_frames: list of opencv images of the model size with BGR color coding, see
+        resize_frame_for_models()
+        :param style_bottleneck: numpy array returned by run_style_predict() for the style image
+        :param content_blending_ratio: how much style of the content video is considered (between 0.0 and 1.0)
+        :param batch_size: number of frames in a single invocation of the models
+        :param model_paths: paths to style predict and style transform models, active models if it is None
+        :param result_pool: buffers stylized frames are written to, new arrays are allocated if it is None
+        :return: list of stylized frames as BGR uint8 numpy arrays in the order of content_frames
+        """
+        height, width = content_frames[0].shape[:2]
+        style_size = 256
+        predict_model_path, transform_model_path = StyleTransfer.resolve_model_paths(model_paths)
+        with StyleTransfer.interpreter_pool.acquire(transform_model_path,
+                                                    [(batch_size, height, width, 3), style_bottleneck.shape]) \
+                as transform_interpreter:
+            input_details = transform_interpreter.get_input_details()
+
+            # views of interpreter tensors must not outlive invoke(), so they are never stored
+            content_input = transform_interpreter.tensor(input_details[0]["index"])()
+            for i, content_frame in enumerate(content_frames):
+                convert_opencv_image_to_tensor(content_frame, content_input[i:i + 1])
+            content_input[len(content_frames):] = content_input[len(content_frames) - 1]
+
+            with StyleTransfer.interpreter_pool.acquire(predict_model_path,
+                                                        [(batch_size, style_size, style_size, 3)]) \
+                    as predict_interpreter:
+                preprocess_image(content_input, style_size,
+                                 predict_interpreter.tensor(predict_interpreter.get_input_details()[0]["index"])())
+                predict_interpreter.invoke()
+                style_bottleneck_content = predict_interpreter.get_tensor(
+                    predict_interpreter.get_output_details()[0]["index"])
+            del content_input
+
+            style_bottleneck_blended = StyleTransfer.blend_style_bottlenecks(style_bottleneck,
+                                                                             style_bottleneck_content,
+                                                                             content_blending_ratio)
+            transform_interpreter.set_tensor(input_details[1]["index"], style_bottleneck_blended)
+            transform_interpreter.invoke()
+
+            result_images = transform_interpreter.tensor(transform_interpreter.get_output_details()[0]["index"])()
+            result_frames = [cv.normalize(result_image, result_pool.acquire() if result_pool is not None else None,
+                                          255, 0, cv.NORM_MINMAX, cv.CV_8U)
+                             for result_image in result_images[:len(content_frames)]]
+            del result_images
+
+        for result_frame in result_frames:
+            cv.cvtColor(result_frame, cv.COLOR_RGB2BGR, dst=result_frame)
+
+        return result_frames
+
+    @staticmethod
+    def decode_frames(video_capture_object: cv.VideoCapture, frames_count: int = None,
+                      frame_pool: FrameBufferPool = None):
+        """Pipeline stage reading frames of the video
+        :param video_capture_object: opened video
+        :param frames_count: maximum number of frames to read, the whole video is read if it is None
+        :param frame_pool: buffers frames are decoded into, a new array is allocated for every frame if it is None
+        :return: generator of opencv images with BGR color coding"""
         count = 0
-        if os.getenv("INTERPOLATION") == "TRUE":
-            prev_frame = None
-            INTERPOLATION_STEP = int(os.getenv("INTERPOLATION_STEP"))
-            while True:
-                success, image = video_capture_object.read()
-                if not success:
-                    break
-
-                if count % INTERPOLATION_STEP == 0:
-                    content_image_frame = preprocess_image(convert_opencv_image_to_tensor(image), 384)
-
-                    result_image_frame = StyleTransfer.stylize_image(content_image_frame, style_image,
-                                                                     content_blending_ratio)
-                    result_image_frame = cv.normalize(result_image_frame, None, 255, 0, cv.NORM_MINMAX, cv.CV_8U)
-                    result_image_frame = cv.cvtColor(result_image_frame, cv.COLOR_RGB2BGR)
-
-                    if count > 0:
-                        for i in range(1, INTERPOLATION_STEP):
-                            interpolated_frame = cv.addWeighted(result_image_frame, i / INTERPOLATION_STEP,
-                                                                prev_frame, 1 - i / INTERPOLATION_STEP, 1)
-                            out.write(interpolated_frame)
-
-                    out.write(result_image_frame)
-                    prev_frame = result_image_frame
-
-                count += 1
-                progress_signal.emit(int(count * 100 / frame_counter))
-
-            if count % INTERPOLATION_STEP > 1:
-                for i in range(1, count % INTERPOLATION_STEP):
-                    interpolated_frame = cv.addWeighted(result_image_frame, i / (count % INTERPOLATION_STEP),
-                                                        prev_frame, 1 - i / (count % INTERPOLATION_STEP), 1)
-                    out.write(interpolated_frame)
-                out.write(result_image_frame)
-        else:
-            while True:
-                success, image = video_capture_object.read()
-                if not success:
-                    break
+        while frames_count is None or count < frames_count:
+            count += 1
+            buffer = frame_pool.acquire() if frame_pool is not None else None
+            success, image = video_capture_object.read(buffer)
+            if not success:
+                return
+            yield image
 
-                content_image_frame = preprocess_image(convert_opencv_image_to_tensor(image), 384)
+    @staticmethod
+    def preprocess_frames(frames, keyframe_selector: KeyframeSelector, duplicate_cache: DuplicateFrameCache,
+                          statistics: VideoStatistics, keep_resolution: bool, model_frame_size: tuple,
+                          frame_pool: FrameBufferPool, content_pool: FrameBufferPool):
+        """Pipeline stage selecting and preprocessing keyframes, frames between them are interpolated
+        :param frames: iterable of opencv images with BGR color coding
+        :param keyframe_selector: decides which frames are stylized
+        :param duplicate_cache: recently stylized frames or None if duplicates are not detected
+        :param statistics: counters of processed frames
+        :param keep_resolution: if source frames are kept for upsampling of stylized frames
+        :param model_frame_size: (width, height) of frames given to the models, see get_model_frame_size()
+        :param frame_pool: pool of decoded frames, frames which are not kept are released to it
+        :param content_pool: pool of buffers for frames resized to the model size, content of keyframes is released
+        by stylize_frames()
+        :return: generator of FrameRecord with content set for keyframes which have to be stylized"""
+
+        for index, image in enumerate(frames):
+            record = FrameRecord(index)
+            if keep_resolution:
+                record.image = image
+
+            model_frame = None
+            if keyframe_selector.needs_guides():
+                model_frame = StyleTransfer.resize_frame_for_models(image, keep_resolution, content_pool.acquire())
+                record.guide = cv.cvtColor(model_frame, cv.COLOR_BGR2GRAY)
+            signature = compute_frame_signature(image) if keyframe_selector.needs_signatures() else None
+
+            keyframe_selector.select(record, record.guide, signature)
+            statistics.frames += 1
+
+            if not record.is_keyframe:
+                content_pool.release(model_frame)
+                statistics.interpolated_frames += 1
+                if not keep_resolution:
+                    frame_pool.release(image)
+                yield record
+                continue
+
+            # a keyframe looking the same as a recently stylized frame reuses its result
+            if duplicate_cache is not None:
+                frame_hash = compute_perceptual_hash(image)
+                record.duplicate_of = duplicate_cache.find(frame_hash)
+                if record.duplicate_of is None:
+                    duplicate_cache.add(frame_hash, record)
+
+            if record.duplicate_of is None:
+                if model_frame is None:
+                    model_frame = StyleTransfer.resize_frame_for_models(image, keep_resolution,
+                                                                        content_pool.acquire())
+                record.content = model_frame
+                statistics.stylized_frames += 1
+            else:
+                content_pool.release(model_frame)
+                statistics.duplicate_frames += 1
+
+            if not keep_resolution:
+                frame_pool.release(image)
+            yield record
 
-                result_image_frame = StyleTransfer.stylize_image(content_image_frame, style_image, content_blending_ratio)
-                result_image_frame = cv.normalize(result_image_frame, None, 255, 0, cv.NORM_MINMAX, cv.CV_8U)
-                result_image_frame = cv.cvtColor(result_image_frame, cv.COLOR_RGB2BGR)
-                out.write(result_image_frame)
+    @staticmethod
+    def get_model_frame_size(source_frame_size: tuple, keep_resolution: bool) -> tuple:
+        """Size of video frames given to the models
+        :param source_frame_size: (width, height) of frames of the video
+        :param keep_resolution: if whole frames are stylized, otherwise they are central cropped to a square
+        :return: (width, height), with kept resolution the shorter side is CONTENT_IMAGE_SIZE and the aspect ratio of
+        the video is kept, rounded to a multiple of 4 which the style transform network downsamples to"""
+        size = StyleTransfer.CONTENT_IMAGE_SIZE
+        if not keep_resolution:
+            return size, size
+
+        width, height = source_frame_size
+        scale = size / max(min(width, height), 1)
+        return max(round(width * scale / 4) * 4, size), max(round(height * scale / 4) * 4, size)
 
-                count += 1
-                progress_signal.emit(int(count*100/frame_counter))
+    @staticmethod
+    def resize_frame_for_models(image, keep_resolution: bool, out):
+        """Resize a video frame to the content size of the models
+        :param image: opencv image
+        :param keep_resolution: if the whole frame is resized to the size of out, see get_model_frame_size(),
+        otherwise the frame is central cropped like in preprocess_image()
+        :param out: array of the result shape to write the result to
+        :return: out with the resized image"""
+        if keep_resolution:
+            return cv.resize(image, (out.shape[1], out.shape[0]), dst=out, interpolation=cv.INTER_AREA)
+
+        return resize_and_crop_opencv_image(image, StyleTransfer.CONTENT_IMAGE_SIZE, out)
 
-        out.release()
+    @staticmethod
+    def stylize_frames(records, style_bottleneck, content_blending_ratio: float, batch_size: int,
+                       content_pool: FrameBufferPool, model_paths: tuple = None,
+                       result_pool: FrameBufferPool = None):
+        """Pipeline stage stylizing keyframes in batches of batch_size
+        :param records: iterable of FrameRecord, see preprocess_frames()
+        :param style_bottleneck: numpy array returned by run_style_predict() for the style image
+        :param content_blending_ratio: how much style of the content video is considered (between 0.0 and 1.0)
+        :param batch_size: number of frames in a single invocation of the models
+        :param content_pool: pool to which content of stylized keyframes is released
+        :param model_paths: paths to style predict and style transform models, active models if it is None
+        :param result_pool: buffers results are written to, released by encode_frames(), None if results are shared
+        with duplicates
+        :return: generator of FrameRecord with result set for all keyframes"""
+        pending_records = []
+        keyframes = []
+
+        def flush():
+            if keyframes:
+                result_frames = StyleTransfer.stylize_frame_batch([record.content for record in keyframes],
+                                                                  style_bottleneck, content_blending_ratio,
+                                                                  batch_size, model_paths, result_pool)
+                for record, result_frame in zip(keyframes, result_frames):
+                    record.result = result_frame
+                    content_pool.release(record.content)
+                    record.content = None
+
+            for record in pending_records:
+                if record.duplicate_of is not None:
+                    record.result = record.duplicate_of.result
+            yield from pending_records
+
+        for record in records:
+            pending_records.append(record)
+            if record.content is not None:
+                keyframes.append(record)
+
+            # frames which do not wait for the models are passed on without waiting for a full batch,
+            # a partial batch is stylized if too many frames wait for it, e.g. during a long run of duplicates
+            if not keyframes or len(keyframes) == batch_size or \
+                    len(pending_records) >= StyleTransfer.MAX_PENDING_FRAMES:
+                yield from flush()
+                pending_records = []
+                keyframes = []
+
+        yield from flush()
 
-        return result_video_path
+    @staticmethod
+    def encode_frames(records, out: cv.VideoWriter, frame_counter: int, progress_signal: pyqtSignal(int),
+                      interpolation_mode: InterpolationMode, frame_pool: FrameBufferPool,
+                      result_pool: FrameBufferPool = None):
+        """Pipeline stage writing stylized frames and interpolating frames between them
+        :param records: iterable of FrameRecord, see stylize_frames()
+        :param out: writer of the result video
+        :param frame_counter: number of frames in the video, used for progress
+        :param progress_signal: signal to emit every written keyframe
+        :param interpolation_mode: how frames between keyframes are created
+        :param frame_pool: pool to which kept source frames are released after they are written
+        :param result_pool: pool to which results are released once no frame is interpolated from them, None if
+        results are shared with duplicates
+        :return: generator of indexes of written keyframes"""
+        prev_record = None
+        interpolated_records = []
+        upsampler = GuidedUpsampler()
+
+        def write(record, frame):
+            # source frame is the guide for upsampling to the source resolution
+            if record.image is not None:
+                frame = upsampler.upsample(frame, record.image)
+                frame_pool.release(record.image)
+                record.image = None
+            out.write(frame)
+
+        for record in records:
+            if not record.is_keyframe:
+                interpolated_records.append(record)
+                continue
+
+            if prev_record is not None:
+                # frames before a scene cut are created only from the previous keyframe
+                next_frame, next_guide = (None, None) if record.scene_cut else (record.result, record.guide)
+                interpolated_frames = interpolate_frames(prev_record.result, prev_record.guide, next_frame, next_guide,
+                                                         [r.guide for r in interpolated_records], interpolation_mode)
+                for interpolated_record, interpolated_frame in zip(interpolated_records, interpolated_frames):
+                    write(interpolated_record, interpolated_frame)
+
+            write(record, record.result)
+            if prev_record is not None and result_pool is not None:
+                result_pool.release(prev_record.result)
+            prev_record = record
+            interpolated_records = []
+
+            progress_signal.emit(min(int((record.index + 1) * 100 / max(frame_counter, 1)), 100))
+            yield record.index
+
+        # frames after the last stylized frame are created only from it
+        if prev_record is not None:
+            interpolated_frames = interpolate_frames(prev_record.result, prev_record.guide, None, None,
+                                                     [r.guide for r in interpolated_records], interpolation_mode)
+            for interpolated_record, interpolated_frame in zip(interpolated_records, interpolated_frames):
+                write(interpolated_record, interpolated_frame)
+            if result_pool is not None:
+                result_pool.release(prev_record.result)
 
     @staticmethod
     def find_next_result_video_path():
@@ -214,3 +878,61 @@ class StyleTransfer:
                         max_number = int(entry.name[7])
 
         return f"{directory_path}/result-{max_number+1}.avi"
+
+
+class StylizationCancelled(Exception):
+    """Raised by a stylization which was stopped by its cancel event"""
+
+
+class RangeProgressSignal:
+    """Progress signal of a range of frames, progress of the range is converted to progress of the whole video"""
+
+    def __init__(self, progress_signal, done_frames: int, range_frames: int, frame_counter: int):
+        """
+        :param progress_signal: signal emitting progress of the whole video
+        :param done_frames: number of frames stylized before the range
+        :param range_frames: number of frames in the range
+        :param frame_counter: number of frames in the video
+        """
+        self.progress_signal = progress_signal
+        self.done_frames = done_frames
+        self.range_frames = range_frames
+        self.frame_counter = frame_counter
+
+    def emit(self, value: int):
+        done_frames = self.done_frames + value * self.range_frames / 100
+        self.progress_signal.emit(min(int(done_frames * 100 / max(self.frame_counter, 1)), 100))
+
+
+class QueueProgressSignal:
+    """Replacement of progress signal in worker processes, progress is sent to the main process by a queue as
+    (shard index, stylized frames of the current segment, index of a segment which was just finished or None,
+    statistics of the finished segment or None)"""
+
+    def __init__(self, progress_queue, shard_index: int, range_frames: int):
+        self.progress_queue = progress_queue
+        self.shard_index = shard_index
+        self.range_frames = range_frames
+
+    def emit(self, value: int):
+        self.progress_queue.put((self.shard_index, int(value * self.range_frames / 100), None, None))
+
+    def complete_segment(self, segment_index: int, statistics: VideoStatistics):
+        self.progress_queue.put((self.shard_index, 0, segment_index, statistics.as_dict()))
+
+
+def stylize_video_shard(shard_index: int, content_video_path: str, segments: list, frame_counter: int,
+                        style_bottleneck, content_blending_ratio: float, model_paths: tuple, codec: str,
+                        progress_queue):
+    """Entry point of a worker process stylizing segments of a video, see StyleTransfer.stylize_video_in_shards()
+    :param segments: list of (segment index, start frame, end frame, output path)
+    :param model_paths: paths to style predict and style transform models
+    :param codec: fourcc of segment videos"""
+
+    for segment_index, start_frame, end_frame, output_path in segments:
+        range_frames = (frame_counter if end_frame is None else end_frame) - start_frame
+        progress = QueueProgressSignal(progress_queue, shard_index, range_frames)
+        statistics = StyleTransfer.stylize_frame_range(content_video_path, start_frame, end_frame, output_path,
+                                                       style_bottleneck, content_blending_ratio, progress,
+                                                       model_paths, codec)
+        progress.complete_segment(segment_index, statistics)
@@ -1,20 +1,22 @@
 import os
-from pathlib import Path
 
 import numpy as np
 import torch
 from PIL import Image
 
 from logic import vae_models
+from logic.model_registry import get_model_registry
 import torchvision.transforms as transforms
 
 
 class StyleTransferVAE:
-    encoder_dir = Path('assets/models/encoder.pth')
-    decoder_dir = Path('assets/models/decoder.pth')
-    transform_module_dir = Path('assets/models/transform-module.pth')
 
     def __init__(self):
+        registry = get_model_registry()
+        self.encoder_dir = registry.get_model_path('vae_encoder')
+        self.decoder_dir = registry.get_model_path('vae_decoder')
+        self.transform_module_dir = registry.get_model_path('vae_transform_module')
+
         self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
         # initialize model modules
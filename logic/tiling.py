@@ -0,0 +1,29 @@
+import numpy as np
+
+
+def get_tile_positions(length: int, tile_size: int, overlap: int) -> list:
+    """Positions of overlapping tiles covering a dimension of an image, the last tile ends at the image border
+    :param length: size of the image dimension, at least tile_size
+    :param tile_size: size of a tile
+    :param overlap: number of pixels shared by neighbouring tiles
+    :return: list of tile start positions"""
+    if length <= tile_size:
+        return [0]
+
+    stride = max(tile_size - overlap, 1)
+    positions = list(range(0, length - tile_size, stride))
+    positions.append(length - tile_size)
+    return positions
+
+
+def create_feather_window(tile_size: int, overlap: int):
+    """Weights used to blend overlapping tiles, they fall linearly to zero in the overlapping border of a tile
+    :param tile_size: size of a tile
+    :param overlap: number of pixels shared by neighbouring tiles
+    :return: float32 array of shape (tile_size, tile_size, 1)"""
+    ramp = np.ones(tile_size, dtype=np.float32)
+    if overlap > 0:
+        distance_to_border = np.minimum(np.arange(tile_size), np.arange(tile_size)[::-1]) + 0.5
+        ramp = np.minimum(distance_to_border / overlap, 1.0).astype(np.float32)
+
+    return np.outer(ramp, ramp)[..., np.newaxis]
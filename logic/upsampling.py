@@ -0,0 +1,68 @@
+import cv2 as cv
+import numpy as np
+
+
+class GuidedUpsampler:
+    """Upsampling of images to the resolution of a guide image with the fast guided filter. Coefficients of the
+    locally linear model between the guide and the image are calculated in low resolution and only applied in
+    full resolution, so edges of the guide are restored at a cost of a few box filters. Arrays of the full
+    resolution are allocated once and reused for images of the same size, e.g. frames of a video"""
+
+    def __init__(self, radius: int = 4, eps: float = 1e-3):
+        """
+        :param radius: radius of the box filter in pixels of the low resolution image
+        :param eps: regularization, higher values give smoother results
+        """
+        self.kernel_size = (2 * radius + 1, 2 * radius + 1)
+        self.eps = eps
+
+        self._buffers = {}
+
+    def _get_buffer(self, name: str, shape: tuple, dtype=np.float32):
+        """:return: array kept under name, a new one if the kept array has another shape"""
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+
+    def _box(self, image):
+        blurred = cv.boxFilter(image, -1, self.kernel_size, borderType=cv.BORDER_REFLECT)
+        return blurred.reshape(image.shape)
+
+    def upsample(self, low_resolution_image, guide_image):
+        """Upsample an image to the resolution of a guide image
+        :param low_resolution_image: BGR uint8 image, e.g. a stylized frame
+        :param guide_image: BGR uint8 image in the target resolution, e.g. the source frame
+        :return: BGR uint8 image of the size of guide_image, it is overwritten by the next call"""
+        height, width = guide_image.shape[:2]
+        low_height, low_width = low_resolution_image.shape[:2]
+
+        gray_guide = self._get_buffer('gray_guide', (height, width), np.uint8)
+        guide = self._get_buffer('guide', (height, width))
+        mean_a = self._get_buffer('mean_a', (height, width, 3))
+        mean_b = self._get_buffer('mean_b', (height, width, 3))
+        result = self._get_buffer('result', (height, width, 3), np.uint8)
+
+        cv.cvtColor(guide_image, cv.COLOR_BGR2GRAY, dst=gray_guide)
+        np.multiply(gray_guide, np.float32(1 / 255), out=guide)
+        low_guide = cv.resize(guide, (low_width, low_height), interpolation=cv.INTER_AREA)[..., np.newaxis]
+        low_image = low_resolution_image.astype(np.float32) / 255
+
+        mean_guide = self._box(low_guide)
+        mean_image = self._box(low_image)
+        covariance = self._box(low_guide * low_image) - mean_guide * mean_image
+        variance = self._box(low_guide * low_guide) - mean_guide * mean_guide
+
+        a = covariance / (variance + self.eps)
+        b = mean_image - a * mean_guide
+
+        cv.resize(self._box(a), (width, height), dst=mean_a, interpolation=cv.INTER_LINEAR)
+        cv.resize(self._box(b), (width, height), dst=mean_b, interpolation=cv.INTER_LINEAR)
+
+        # result = mean_a * guide + mean_b, computed in place in the full resolution
+        np.multiply(mean_a, guide[..., np.newaxis], out=mean_a)
+        np.add(mean_a, mean_b, out=mean_a)
+        np.multiply(mean_a, 255, out=mean_a)
+        np.clip(mean_a, 0, 255, out=mean_a)
+        np.copyto(result, mean_a, casting='unsafe')
+        return result
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+
+class VideoStylizationJob:
+    """Checkpoint of a video stylization, the video is stylized in segments of frames which are written to separate
+    files, and a manifest records which segments are finished. Running the same job again (same video, style,
+    blending ratio and settings) resumes from the finished segments instead of starting from the first frame"""
+
+    JOBS_DIRECTORY = 'assets/results/style-video/jobs'
+    MANIFEST_NAME = 'manifest.json'
+
+    def __init__(self, content_video_path: str, style_hash: str, content_blending_ratio: float, frame_counter: int,
+                 segment_frames: int, settings: dict):
+        """
+        :param content_video_path: path to video
+        :param style_hash: content hash of the style image and the style predict model
+        :param content_blending_ratio: how much style of the content video is considered (between 0.0 and 1.0)
+        :param frame_counter: number of frames in the video, 0 if it is unknown
+        :param segment_frames: number of frames in a segment
+        :param settings: other values which change the result, e.g. models and interpolation settings
+        """
+        video_stat = os.stat(content_video_path)
+        self.description = {
+            'video': os.path.abspath(content_video_path),
+            'video_size': video_stat.st_size,
+            'video_mtime': video_stat.st_mtime,
+            'style_hash': style_hash,
+            'content_blending_ratio': content_blending_ratio,
+            'settings': settings,
+        }
+
+        job_id = hashlib.sha256(json.dumps(self.description, sort_keys=True).encode()).hexdigest()[:16]
+        self.directory = Path(VideoStylizationJob.JOBS_DIRECTORY) / job_id
+
+        # the last segment is read to the end of the video, as the frame count in the header is only an estimate,
+        # with unknown number of frames the whole video is a single segment
+        segment_frames = max(segment_frames, 1)
+        self.segments = [(start, start + segment_frames)
+                         for start in range(0, frame_counter - segment_frames, segment_frames)]
+        self.segments.append((self.segments[-1][1] if self.segments else 0, None))
+        self.completed_segments = set()
+
+        self.load_manifest()
+
+    def load_manifest(self):
+        """Restore finished segments from the manifest of a previous run of the same job"""
+        manifest_path = self.directory / VideoStylizationJob.MANIFEST_NAME
+        if not manifest_path.exists():
+            return
+
+        try:
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError) as error:
+            logging.getLogger().warning(f'Could not read video job manifest {manifest_path}: {error}')
+            return
+
+        # segments may have been split for parallel shards, any contiguous segmentation of the video is resumed
+        segments = [tuple(segment) for segment in manifest.get('segments', [])]
+        if not segments or segments[0][0] != 0 or segments[-1][1] is not None or \
+                any(end != next_start for (_, end), (next_start, _) in zip(segments[:-1], segments[1:])):
+            return
+
+        self.segments = segments
+        self.completed_segments = {index for index in manifest.get('completed_segments', [])
+                                   if os.path.exists(self.segment_path(index))}
+        if self.completed_segments:
+            logging.getLogger().info(f'Resuming video job {self.directory.name}, '
+                                     f'{len(self.completed_segments)}/{len(self.segments)} segments are finished')
+
+    def save_manifest(self):
+        """Atomically write the manifest, so it is valid even if the application crashes while saving it"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        manifest = dict(self.description, segments=self.segments, completed_segments=sorted(self.completed_segments))
+
+        temporary_path = self.directory / f'{VideoStylizationJob.MANIFEST_NAME}.tmp'
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temporary_path, self.directory / VideoStylizationJob.MANIFEST_NAME)
+
+    def split_pending_segments(self, count: int, frame_counter: int):
+        """Split the longest pending segments in halves until at least count segments are pending, so the pending
+        frames can be stylized by count processes even in a short video. Finished segments are kept
+        :param count: required number of pending segments
+        :param frame_counter: number of frames in the video, segments of unknown length are not split"""
+        completed = {self.segments[index] for index in self.completed_segments}
+        pending_segments = self.pending_segments()
+        while pending_segments and len(pending_segments) < count:
+            index = max(pending_segments, key=lambda i: self.segment_frames_count(i, frame_counter))
+            frames = self.segment_frames_count(index, frame_counter)
+            if frames < 2:
+                break
+
+            start_frame, end_frame = self.segments[index]
+            self.segments[index:index + 1] = [(start_frame, start_frame + frames // 2),
+                                              (start_frame + frames // 2, end_frame)]
+            self.completed_segments = {i for i, segment in enumerate(self.segments) if segment in completed}
+            pending_segments = self.pending_segments()
+
+        self.save_manifest()
+
+    def pending_segments(self) -> list:
+        """:return: indexes of segments which are not finished yet"""
+        return [index for index in range(len(self.segments)) if index not in self.completed_segments]
+
+    def segment_frames_count(self, index: int, frame_counter: int) -> int:
+        """:return: number of frames in a segment, frame_counter is used for a segment ending with the video"""
+        start_frame, end_frame = self.segments[index]
+        return (frame_counter if end_frame is None else end_frame) - start_frame
+
+    def segment_path(self, index: int) -> str:
+        """:return: path to the video of a finished segment"""
+        return str(self.directory / f'segment-{self.segments[index][0]}.avi')
+
+    def partial_segment_path(self, index: int) -> str:
+        """:return: path to which the segment is written until it is finished"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return str(self.directory / f'segment-{self.segments[index][0]}-partial.avi')
+
+    def complete_segment(self, index: int):
+        """Mark the segment written to partial_segment_path() as finished"""
+        os.replace(self.partial_segment_path(index), self.segment_path(index))
+        self.completed_segments.add(index)
+        self.save_manifest()
+
+    def segment_paths(self) -> list:
+        """:return: paths to videos of all segments in order"""
+        return [self.segment_path(index) for index in range(len(self.segments))]
+
+    def remove(self):
+        """Remove the checkpoint after the result video was written"""
+        shutil.rmtree(self.directory, ignore_errors=True)
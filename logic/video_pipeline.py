@@ -0,0 +1,169 @@
+import queue
+import threading
+
+import numpy as np
+
+
+class FramePipeline:
+    """Runs stages of video processing concurrently, each stage works in its own thread and stages are connected
+    by bounded queues, so a fast stage waits for a slow one instead of buffering the whole video (backpressure).
+
+    A stage is a function which takes an iterable of items from the previous stage and yields items for the next
+    one. Every stage consumes its input in order in a single thread, so the order of frames is kept. The last stage
+    runs in the calling thread."""
+
+    _END = object()
+    _POLL_INTERVAL = 0.1
+
+    def __init__(self, queue_size: int):
+        """:param queue_size: maximum number of items waiting between two stages"""
+        self.queue_size = max(queue_size, 1)
+        self.stages = []
+
+        self._stop_event = threading.Event()
+        self._errors = []
+
+    def add_stage(self, stage):
+        """Append a stage, the first stage gets an empty iterable as input
+        :param stage: function taking an iterable and returning an iterable"""
+        self.stages.append(stage)
+        return self
+
+    def run(self):
+        """Run all stages and wait until the last one consumes all items, exception raised in any stage stops
+        the whole pipeline and is raised again in the calling thread"""
+        if not self.stages:
+            return
+
+        input_queue = None
+        threads = []
+        for stage in self.stages[:-1]:
+            output_queue = queue.Queue(maxsize=self.queue_size)
+            thread = threading.Thread(target=self._run_stage, args=(stage, input_queue, output_queue), daemon=True)
+            threads.append(thread)
+            input_queue = output_queue
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            for _ in self.stages[-1](self._iterate(input_queue)):
+                pass
+        except BaseException as error:
+            self._errors.append(error)
+        finally:
+            self._stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+    def _run_stage(self, stage, input_queue, output_queue):
+        try:
+            for item in stage(self._iterate(input_queue)):
+                if not self._put(output_queue, item):
+                    return
+        except BaseException as error:
+            self._errors.append(error)
+            self._stop_event.set()
+        finally:
+            self._put(output_queue, self._END)
+
+    def _iterate(self, input_queue):
+        if input_queue is None:
+            return
+
+        while not self._stop_event.is_set():
+            try:
+                item = input_queue.get(timeout=self._POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            if item is self._END:
+                return
+            yield item
+
+    def _put(self, output_queue, item) -> bool:
+        while not self._stop_event.is_set():
+            try:
+                output_queue.put(item, timeout=self._POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class FrameBufferPool:
+    """Reusable arrays for frames passed between stages of the pipeline, a stage takes a buffer by acquire() and
+    the stage which is done with it gives it back by release(). Only as many buffers are allocated as there are
+    frames in flight at the same time, arrays which do not come from a pool are still allocated per frame"""
+
+    def __init__(self, shape, dtype):
+        """
+        :param shape: shape of every buffer
+        :param dtype: data type of every buffer
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        self._idle_buffers = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """:return: an idle buffer or a new one if all are in use, its content is undefined"""
+        with self._lock:
+            if self._idle_buffers:
+                return self._idle_buffers.pop()
+        return np.empty(self.shape, dtype=self.dtype)
+
+    def release(self, buffer):
+        """Give a buffer back to the pool, it must not be used by the caller afterwards. Arrays of other shapes,
+        e.g. frames which were reallocated by the decoder, are dropped"""
+        if buffer is None or buffer.shape != self.shape or buffer.dtype != self.dtype:
+            return
+        with self._lock:
+            self._idle_buffers.append(buffer)
+
+
+class FrameRecord:
+    """Frame of a video passed between stages of the stylization pipeline"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.image = None  # decoded BGR frame, kept only for upsampling to the source resolution
+        self.is_keyframe = False
+        self.scene_cut = False  # the frame starts a new shot, so it is not interpolated with previous frames
+        self.content = None  # preprocessed keyframe for the models
+        self.guide = None  # grayscale frame used for optical flow
+        self.result = None  # stylized BGR keyframe
+        self.duplicate_of = None  # earlier keyframe whose result is reused for this keyframe
+
+
+class VideoStatistics:
+    """Counters of frames processed by video stylization"""
+
+    def __init__(self, frames: int = 0, stylized_frames: int = 0, interpolated_frames: int = 0,
+                 duplicate_frames: int = 0):
+        self.frames = frames
+        self.stylized_frames = stylized_frames  # frames processed by the models
+        self.interpolated_frames = interpolated_frames  # frames created from neighbouring keyframes
+        self.duplicate_frames = duplicate_frames  # keyframes which reused result of a previous frame
+
+    def add(self, other):
+        """Add counters of other statistics, e.g. of another segment of the video"""
+        self.frames += other.frames
+        self.stylized_frames += other.stylized_frames
+        self.interpolated_frames += other.interpolated_frames
+        self.duplicate_frames += other.duplicate_frames
+
+    def skipped_frames(self) -> int:
+        """:return: number of frames which did not go through the models"""
+        return self.interpolated_frames + self.duplicate_frames
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    def __str__(self):
+        return f'{self.frames} frames, {self.stylized_frames} stylized, {self.interpolated_frames} interpolated, ' \
+               f'{self.duplicate_frames} duplicates'
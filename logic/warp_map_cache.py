@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+
+class WarpMapCache:
+    """Disk cache of trained morphing warp maps, entries are addressed by the content of both preprocessed images,
+    the warp parameters and the number of training epochs. Together with the warp maps a checkpoint of the model
+    and the optimizer is kept, so training with more epochs continues from the longest cached training instead of
+    starting from scratch"""
+
+    _ENTRY_PATTERN = re.compile(r'^(?P<key>[0-9a-f]{64})-(?P<epochs>\d+)\.npy$')
+
+    def __init__(self, directory: str, max_entries: int):
+        """
+        :param directory: directory where warp maps and checkpoints are stored
+        :param max_entries: how many trainings are kept on disk, 0 disables the cache
+        """
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+
+        if self.max_entries > 0:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(origins, targets, parameters: dict) -> str:
+        """Create cache key from a content hash of both images and parameters of the warp
+        :param origins: preprocessed source image as a numpy array
+        :param targets: preprocessed target image as a numpy array
+        :param parameters: values which change the trained warp maps except the number of epochs
+        :return: hex digest identifying the pair of images"""
+        digest = hashlib.sha256()
+        for image in (origins, targets):
+            image = np.ascontiguousarray(image, dtype=np.float32)
+            digest.update(image.tobytes())
+            digest.update(str(image.shape).encode())
+        digest.update(json.dumps(parameters, sort_keys=True).encode())
+
+        return digest.hexdigest()
+
+    def get(self, key: str, epochs: int):
+        """Return cached warp maps trained for exactly the given number of epochs or None if they are not cached"""
+        if self.max_entries <= 0:
+            return None
+
+        path = self._entry_path(key, epochs)
+        try:
+            preds = np.load(path)
+            os.utime(path)  # mark the entry as recently used
+        except (OSError, ValueError):
+            return None
+        return preds
+
+    def find_checkpoint(self, key: str, epochs: int):
+        """Find the longest cached training of the pair which is shorter than epochs
+        :return: tuple of the number of trained epochs and the checkpoint prefix or None"""
+        if self.max_entries <= 0:
+            return None
+
+        cached_epochs = [entry_epochs for entry_key, entry_epochs in self._entries()
+                         if entry_key == key and entry_epochs < epochs and
+                         self._checkpoint_prefix(entry_key, entry_epochs).with_suffix('.ckpt.index').exists()]
+        if not cached_epochs:
+            return None
+
+        return max(cached_epochs), str(self._checkpoint_prefix(key, max(cached_epochs)))
+
+    def put(self, key: str, epochs: int, preds, checkpoint=None):
+        """Store warp maps and the checkpoint of their training, evicting least recently used entries above the limit
+        :param key: key created by make_key()
+        :param epochs: number of epochs the maps were trained for
+        :param preds: warp maps as a numpy array
+        :param checkpoint: tf.train.Checkpoint of the model and the optimizer or None"""
+        if self.max_entries <= 0:
+            return
+
+        try:
+            if checkpoint is not None:
+                checkpoint.write(str(self._checkpoint_prefix(key, epochs)))
+
+            temporary_path = self._entry_path(key, epochs).with_suffix('.tmp.npy')
+            np.save(temporary_path, np.asarray(preds, dtype=np.float32))
+            os.replace(temporary_path, self._entry_path(key, epochs))
+        except OSError as error:
+            logging.getLogger().warning(f'Could not save warp maps to cache: {error}')
+            return
+
+        self._evict()
+
+    def _entries(self) -> list:
+        if not self.directory.exists():
+            return []
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            match = WarpMapCache._ENTRY_PATTERN.match(entry.name)
+            if entry.is_file() and match:
+                entries.append((match['key'], int(match['epochs'])))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort(key=lambda entry: os.path.getmtime(self._entry_path(*entry)))
+        for key, epochs in entries[:len(entries) - self.max_entries]:
+            for path in self.directory.glob(f'{key}-{epochs}.*'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _entry_path(self, key: str, epochs: int) -> Path:
+        return self.directory / f'{key}-{epochs}.npy'
+
+    def _checkpoint_prefix(self, key: str, epochs: int) -> Path:
+        return self.directory / f'{key}-{epochs}.ckpt'
@@ -0,0 +1,175 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class WikiArtClient:
+    """Client downloading random paintings from WikiArt. All requests share one pooled session, the index of
+    paintings is cached for index_ttl seconds and a background thread keeps a queue of already downloaded random
+    paintings, so a painting is usually available without waiting for the network"""
+
+    DEFAULT_BASE_URL = 'https://www.wikiart.org'
+    MOST_VIEWED_PAINTINGS_PATH = '/en/App/Painting/MostViewedPaintings'
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, index_ttl: float = 3600.0, prefetch_size: int = 2,
+                 timeout: float = 10.0, max_attempts: int = 5):
+        """
+        :param base_url: address of WikiArt, e.g. a local server in tests
+        :param index_ttl: number of seconds after which the index of paintings is downloaded again
+        :param prefetch_size: number of random paintings downloaded in advance
+        :param timeout: timeout of a single request in seconds
+        :param max_attempts: number of random paintings tried before a failure is reported
+        """
+        self.base_url = base_url.rstrip('/')
+        self.index_ttl = index_ttl
+        self.timeout = timeout
+        self.max_attempts = max(max_attempts, 1)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4,
+                              max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504]))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._index = None
+        self._index_time = 0.0
+        self._index_lock = threading.Lock()
+
+        # only paintings are kept, a failed download is reported to callers which wait at that moment
+        self._prefetched = deque()
+        self._prefetch_size = max(prefetch_size, 1)
+        self._prefetched_condition = threading.Condition()
+        self._waiting_callers = 0
+        self._failures = 0
+        self._last_error = None
+        self._prefetch_thread = None
+        self._prefetch_lock = threading.Lock()
+        self._retry_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def get_painting_urls(self) -> list:
+        """Return image urls of the most viewed paintings, the index is downloaded only if the cached one expired.
+        An expired index is still used if it cannot be downloaded again
+        :return: list of image urls"""
+        with self._index_lock:
+            if self._index is not None and time.monotonic() - self._index_time < self.index_ttl:
+                return self._index
+
+            try:
+                response = self.session.get(self.base_url + WikiArtClient.MOST_VIEWED_PAINTINGS_PATH,
+                                            timeout=self.timeout)
+                response.raise_for_status()
+                self._index = [painting['image'] for painting in response.json() if painting.get('image')]
+                self._index_time = time.monotonic()
+            except (requests.RequestException, ValueError) as error:
+                if self._index is None:
+                    raise
+                logging.getLogger().warning(f'Could not refresh WikiArt index, using the cached one: {error}')
+
+            return self._index
+
+    def download_image(self, url: str) -> bytes:
+        """:return: content of the image at url"""
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def fetch_random_image(self) -> tuple:
+        """Download a random painting now, another one is tried if the download fails
+        :return: tuple of the image url and its content"""
+        error = None
+        for _ in range(self.max_attempts):
+            url = random.choice(self.get_painting_urls())
+            try:
+                return url, self.download_image(url)
+            except requests.RequestException as download_error:
+                error = download_error
+        raise error
+
+    def start_prefetch(self):
+        """Start downloading random paintings in the background, it does nothing if it already runs"""
+        with self._prefetch_lock:
+            if self._prefetch_thread is None:
+                self._prefetch_thread = threading.Thread(target=self._prefetch, daemon=True)
+                self._prefetch_thread.start()
+
+    def get_random_image(self, timeout: float = None) -> tuple:
+        """Take a random painting downloaded in the background, waits only if none is downloaded yet. A caller
+        waiting for a painting gets the error of the next failed download, earlier failures are never reported
+        :param timeout: maximum number of seconds to wait or None to wait until a painting is downloaded
+        :return: tuple of the image url and its content
+        :raise TimeoutError: if no painting was downloaded within timeout"""
+        self.start_prefetch()
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._prefetched_condition:
+            failures = self._failures
+            self._waiting_callers += 1
+            try:
+                while not self._prefetched:
+                    if self._failures != failures:
+                        raise self._last_error
+
+                    # the pause after a failed download is cut short, so a waiting caller gets a fresh attempt
+                    self._retry_event.set()
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError('No WikiArt painting was downloaded in time')
+                    self._prefetched_condition.wait(remaining)
+
+                painting = self._prefetched.popleft()
+                self._prefetched_condition.notify_all()
+                return painting
+            finally:
+                self._waiting_callers -= 1
+
+    def close(self):
+        """Stop the background downloads and close connections of the session"""
+        self._stop_event.set()
+        self._retry_event.set()
+        with self._prefetched_condition:
+            self._prefetched_condition.notify_all()
+        self.session.close()
+
+    def _prefetch(self):
+        while not self._stop_event.is_set():
+            try:
+                painting = self.fetch_random_image()
+            except (requests.RequestException, ValueError, IndexError) as error:
+                logging.getLogger().warning(f'Could not download a WikiArt painting: {error}')
+                with self._prefetched_condition:
+                    self._retry_event.clear()
+                    if self._waiting_callers:
+                        self._last_error = error
+                        self._failures += 1
+                        self._prefetched_condition.notify_all()
+
+                # downloads are retried after a pause or as soon as a caller waits for a painting
+                self._retry_event.wait(self.timeout)
+                continue
+
+            with self._prefetched_condition:
+                while len(self._prefetched) >= self._prefetch_size and not self._stop_event.is_set():
+                    self._prefetched_condition.wait(1.0)
+                self._prefetched.append(painting)
+                self._prefetched_condition.notify_all()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_wikiart_client() -> WikiArtClient:
+    """:return: client shared by the whole application, WIKIART_BASE_URL environment variable overrides its address"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = WikiArtClient(os.getenv("WIKIART_BASE_URL", WikiArtClient.DEFAULT_BASE_URL))
+        return _default_client
@@ -1,4 +1,7 @@
+import logging
+
 from PyQt6 import QtCore
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
 from PyQt6.QtGui import QIcon, QPixmap
 from PyQt6.QtWidgets import QMainWindow, QHBoxLayout, QWidget, QVBoxLayout, QPushButton, QStackedLayout
 
@@ -50,13 +53,41 @@ class MainWindow(QMainWindow):
 
         self.stacked_layout.setCurrentWidget(self.home_menu)
 
-        # load all models
-        StyleTransfer.load_models()
+        # models are loaded in the background, stylization is enabled when they are ready
+        self.model_warmup_thread = QThread()
+        self.model_warmup_worker = ModelWarmupWorker()
+        self.model_warmup_worker.moveToThread(self.model_warmup_thread)
+        self.model_warmup_thread.started.connect(self.model_warmup_worker.run)
+        self.model_warmup_worker.ready.connect(self.style_image_menu.models_ready)
+        self.model_warmup_worker.ready.connect(self.style_video_menu.models_ready)
+        self.model_warmup_worker.ready.connect(self.model_warmup_thread.quit)
+        self.model_warmup_worker.failed.connect(self.style_image_menu.models_failed)
+        self.model_warmup_worker.failed.connect(self.style_video_menu.models_failed)
+        self.model_warmup_worker.failed.connect(self.model_warmup_thread.quit)
+        self.model_warmup_thread.finished.connect(self.model_warmup_worker.deleteLater)
+        self.model_warmup_thread.finished.connect(self.model_warmup_thread.deleteLater)
+        self.model_warmup_thread.start()
 
     def change_current_widget(self, widget: QWidget):
         self.stacked_layout.setCurrentWidget(widget)
 
 
+class ModelWarmupWorker(QObject):
+    """Class defining worker used for loading models in a separate thread"""
+    ready = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def run(self):
+        try:
+            StyleTransfer.warm_up()
+        except Exception as error:
+            # stylization stays disabled, e.g. models were not fetched to the models directory yet
+            logging.getLogger().exception(f'Could not load models in the background: {error}')
+            self.failed.emit(str(error))
+            return
+        self.ready.emit()
+
+
 class LeftMenu(QWidget):
     def __init__(self):
         super().__init__()
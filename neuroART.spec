@@ -8,7 +8,7 @@ a = Analysis(
     ['init.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('assets/models', 'assets/models')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -1,4 +1,3 @@
-import copy
 import os
 
 import cv2
@@ -6,7 +5,6 @@ from PyQt6.QtCore import Qt, QThread, pyqtSignal, QObject
 from PyQt6.QtGui import QPixmap, QIcon
 from PyQt6.QtWidgets import QWidget, QLabel, QHBoxLayout, QVBoxLayout, QPushButton, QSlider, QProgressBar, QFileDialog
 
-from logic import morphing
 
 
 class MorphingMenu(QWidget):
@@ -24,7 +22,7 @@ class MorphingMenu(QWidget):
         self.morphing_layout.addWidget(self.middle_container, 5)
         self.morphing_layout.addWidget(self.right_container, 2)
 
-        self.frames = []
+        self.frames = None
 
 
 class LeftContainer(QWidget):
@@ -79,6 +77,8 @@ class LeftContainer(QWidget):
 
 
 class MiddleContainer(QWidget):
+    frame_ready = pyqtSignal(int)
+
     def __init__(self):
         super().__init__()
 
@@ -113,6 +113,7 @@ class MiddleContainer(QWidget):
         self.slider.setSingleStep(1)
         self.slider.setObjectName('morphing_slider')
         self.slider.valueChanged.connect(self.handle_slider_value_change)
+        self.frame_ready.connect(self.morph_frame_ready)
         self.layout.addWidget(self.slider)
 
         # progress bar
@@ -158,7 +159,8 @@ class MiddleContainer(QWidget):
 
         position = self.slider.value()
 
-        morphed_image = morphing_menu.frames[position]
+        # the closest rendered frame is shown until the exact one is rendered, see morph_frame_ready()
+        position, morphed_image = morphing_menu.frames.get_nearest_frame(position)
         morphed_image_path = f'assets/results/morphing/morphing_{position}.jpg'
 
         morphed_image = cv2.cvtColor(morphed_image, cv2.COLOR_RGB2BGR)
@@ -169,6 +171,11 @@ class MiddleContainer(QWidget):
                                       Qt.TransformationMode.SmoothTransformation)
         self.image.setPixmap(scaled_pixmap)
 
+    def morph_frame_ready(self, position: int):
+        """Callback to a frame rendered in the background, shows it if the slider is at its position"""
+        if position == self.slider.value():
+            self.handle_slider_value_change()
+
     def start_morphing_training(self):
         self.save_button.setDisabled(True)
         self.train_button.setDisabled(True)
@@ -179,7 +186,7 @@ class MiddleContainer(QWidget):
         right_path = window.morphing_menu.right_container.image_path
 
         self.morphing_thread = QThread()
-        self.morphing_worker = MorphingWorker(morphing.morphing_handler, left_path, right_path)
+        self.morphing_worker = MorphingWorker(run_morphing_handler, left_path, right_path)
         self.morphing_worker.moveToThread(self.morphing_thread)
 
         self.morphing_train_progress_bar.setValue(0)
@@ -195,12 +202,16 @@ class MiddleContainer(QWidget):
 
         self.morphing_thread.start()
 
-    def morphing_training_finished(self, frames: list):
+    def morphing_training_finished(self, frames):
         from main import MainWindow
         window = MainWindow.window(self)
         morphing_menu = window.morphing_menu
 
-        morphing_menu.frames = copy.deepcopy(frames)
+        # frames are synthesized on demand by logic.morphing.MorphFrameProvider
+        if morphing_menu.frames is not None:
+            morphing_menu.frames.close()
+        morphing_menu.frames = frames
+        morphing_menu.frames.frame_ready_signal = self.frame_ready
 
         self.handle_slider_value_change()
 
@@ -304,9 +315,16 @@ class MorphingButton(QPushButton):
             self.clicked.connect(callback)
 
 
+def run_morphing_handler(*args, **kwargs):
+    """Run morphing, TensorFlow is imported only when morphing is used for the first time"""
+    from logic import morphing
+
+    return morphing.morphing_handler(*args, **kwargs)
+
+
 class MorphingWorker(QObject):
     """Class defining worker used for morphing process in a separate thread"""
-    finished = pyqtSignal(list)
+    finished = pyqtSignal(object)
     training_progress = pyqtSignal(int)
     morphing_progress = pyqtSignal(int)
 
@@ -70,11 +70,90 @@ class SettingsMenu(QWidget):
         self.interpolation_form_layout.addWidget(QLabel("step:"))
         self.interpolation_form_layout.addWidget(self.interpolation_val)
 
+        self.optical_flow_form_layout = QHBoxLayout()
+        self.optical_flow_form = QWidget()
+        self.optical_flow_form.setLayout(self.optical_flow_form_layout)
+        self.optical_flow_form.setMaximumWidth(300)
+        self.optical_flow_form_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter)
+        self.optical_flow_checkbox = QCheckBox()
+        self.optical_flow_checkbox.setChecked(os.getenv("INTERPOLATION_MODE") == "FLOW")
+        self.optical_flow_checkbox.stateChanged.connect(self.set_optical_flow)
+
+        self.optical_flow_form_layout.addWidget(QLabel("Optical flow interpolation:"))
+        self.optical_flow_form_layout.addWidget(self.optical_flow_checkbox)
+
+        self.scene_detection_form_layout = QHBoxLayout()
+        self.scene_detection_form = QWidget()
+        self.scene_detection_form.setLayout(self.scene_detection_form_layout)
+        self.scene_detection_form.setMaximumWidth(300)
+        self.scene_detection_form_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter)
+        self.scene_detection_checkbox = QCheckBox()
+        self.scene_detection_checkbox.setChecked(os.getenv("SCENE_DETECTION") == "TRUE")
+        self.scene_detection_checkbox.stateChanged.connect(self.set_scene_detection)
+
+        self.scene_detection_form_layout.addWidget(QLabel("Scene-aware keyframes:"))
+        self.scene_detection_form_layout.addWidget(self.scene_detection_checkbox)
+
+        self.duplicate_detection_form_layout = QHBoxLayout()
+        self.duplicate_detection_form = QWidget()
+        self.duplicate_detection_form.setLayout(self.duplicate_detection_form_layout)
+        self.duplicate_detection_form.setMaximumWidth(300)
+        self.duplicate_detection_form_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter)
+        self.duplicate_detection_checkbox = QCheckBox()
+        self.duplicate_detection_checkbox.setChecked(os.getenv("DUPLICATE_DETECTION") == "TRUE")
+        self.duplicate_detection_checkbox.stateChanged.connect(self.set_duplicate_detection)
+
+        self.duplicate_detection_form_layout.addWidget(QLabel("Reuse duplicate frames:"))
+        self.duplicate_detection_form_layout.addWidget(self.duplicate_detection_checkbox)
+
+        self.batch_size_form_layout = QHBoxLayout()
+        self.batch_size_form = QWidget()
+        self.batch_size_form.setLayout(self.batch_size_form_layout)
+        self.batch_size_form.setMaximumWidth(300)
+        self.batch_size_form_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter)
+        self.batch_size_val = QLineEdit()
+        self.batch_size_val.setValidator(QIntValidator())
+        self.batch_size_val.setMaxLength(2)
+        self.batch_size_val.setText(os.getenv("VIDEO_BATCH_SIZE"))
+        self.batch_size_val.textChanged.connect(self.change_batch_size)
+
+        self.batch_size_form_layout.addWidget(QLabel("Video frames per batch:"))
+        self.batch_size_form_layout.addWidget(self.batch_size_val)
+
+        self.tiled_output_form_layout = QHBoxLayout()
+        self.tiled_output_form = QWidget()
+        self.tiled_output_form.setLayout(self.tiled_output_form_layout)
+        self.tiled_output_form.setMaximumWidth(300)
+        self.tiled_output_form_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter)
+        self.tiled_output_checkbox = QCheckBox()
+        self.tiled_output_checkbox.setChecked(os.getenv("TILED_OUTPUT") == "TRUE")
+        self.tiled_output_checkbox.stateChanged.connect(self.set_tiled_output)
+
+        self.tiled_output_form_layout.addWidget(QLabel("Full resolution image output:"))
+        self.tiled_output_form_layout.addWidget(self.tiled_output_checkbox)
+
+        self.keep_resolution_form_layout = QHBoxLayout()
+        self.keep_resolution_form = QWidget()
+        self.keep_resolution_form.setLayout(self.keep_resolution_form_layout)
+        self.keep_resolution_form.setMaximumWidth(300)
+        self.keep_resolution_form_layout.setAlignment(Qt.AlignmentFlag.AlignHCenter)
+        self.keep_resolution_checkbox = QCheckBox()
+        self.keep_resolution_checkbox.setChecked(os.getenv("VIDEO_KEEP_RESOLUTION") == "TRUE")
+        self.keep_resolution_checkbox.stateChanged.connect(self.set_keep_resolution)
+
+        self.keep_resolution_form_layout.addWidget(QLabel("Keep video resolution:"))
+        self.keep_resolution_form_layout.addWidget(self.keep_resolution_checkbox)
 
         self.settings_layout.addWidget(self.settings_header)
         self.settings_layout.addWidget(QLabel())
         self.settings_layout.addWidget(self.epochs_form)
         self.settings_layout.addWidget(self.interpolation_form)
+        self.settings_layout.addWidget(self.optical_flow_form)
+        self.settings_layout.addWidget(self.scene_detection_form)
+        self.settings_layout.addWidget(self.duplicate_detection_form)
+        self.settings_layout.addWidget(self.batch_size_form)
+        self.settings_layout.addWidget(self.tiled_output_form)
+        self.settings_layout.addWidget(self.keep_resolution_form)
         self.settings_layout.addWidget(self.themes)
         self.set_light_theme()
 
@@ -97,6 +176,15 @@ class SettingsMenu(QWidget):
         self.interpolation_val.setDisabled(self.interpolation_val.isEnabled())
         os.environ["INTERPOLATION"] = "TRUE" if self.interpolation_val.isEnabled() else "FALSE"
 
+    def set_optical_flow(self):
+        os.environ["INTERPOLATION_MODE"] = "FLOW" if self.optical_flow_checkbox.isChecked() else "BLEND"
+
+    def set_scene_detection(self):
+        os.environ["SCENE_DETECTION"] = "TRUE" if self.scene_detection_checkbox.isChecked() else "FALSE"
+
+    def set_duplicate_detection(self):
+        os.environ["DUPLICATE_DETECTION"] = "TRUE" if self.duplicate_detection_checkbox.isChecked() else "FALSE"
+
     def change_interpolation(self, value):
         try:
             x = max(int(value), 1)
@@ -105,3 +193,18 @@ class SettingsMenu(QWidget):
             pass
         finally:
             self.interpolation_val.setText(os.getenv("INTERPOLATION_STEP"))
+
+    def change_batch_size(self, value):
+        try:
+            x = max(int(value), 1)
+            os.environ["VIDEO_BATCH_SIZE"] = str(x)
+        except Exception:
+            pass
+        finally:
+            self.batch_size_val.setText(os.getenv("VIDEO_BATCH_SIZE"))
+
+    def set_tiled_output(self):
+        os.environ["TILED_OUTPUT"] = "TRUE" if self.tiled_output_checkbox.isChecked() else "FALSE"
+
+    def set_keep_resolution(self):
+        os.environ["VIDEO_KEEP_RESOLUTION"] = "TRUE" if self.keep_resolution_checkbox.isChecked() else "FALSE"
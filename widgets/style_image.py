@@ -1,24 +1,23 @@
+import functools
 import logging
 import os
-import random
-from io import BytesIO
-
-import requests
+import threading
 from pathlib import Path
 
-import tensorflow as tf
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QThread, QObject, pyqtSignal
 from PyQt6.QtGui import QPixmap, QIcon
 from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QGridLayout, QSlider, QFileDialog, \
-    QCheckBox
+    QCheckBox, QProgressBar
 from PIL import Image
 
+from logic.image_cache import ImageCache, get_image_cache
 from logic.preprocessing import preprocess_image, load_img, load_img_from_url
-from logic.style_transfer import StyleTransfer
-from logic.style_transfer_vae import StyleTransferVAE
+from logic.style_transfer import StyleTransfer, StylizationCancelled
+from widgets.stylization_status import StylizationErrorLabel, StylizationStatusMixin
+from widgets.wikiart_loader import WikiArtImageLoader
 
 
-class StyleImageMenu(QWidget):
+class StyleImageMenu(StylizationStatusMixin, QWidget):
     """Class defining GUI for image style transfer module"""
 
     num_of_results = 0
@@ -27,6 +26,10 @@ class StyleImageMenu(QWidget):
 
     is_content_image_from_url = False
     is_style_image_from_url = False
+    stylization_thread = None
+    stylization_worker = None
+    running_request = None
+    pending_request = None
 
     def __init__(self):
 
@@ -34,9 +37,12 @@ class StyleImageMenu(QWidget):
 
         StyleImageMenu.search_for_results()
 
-        self.style_transformer_vae = StyleTransferVAE()
+        self.style_transformer_vae = None  # created on first use, it imports torch and loads its models
         self.use_vae_style_transformer = False
 
+        self.wikiart_loader = WikiArtImageLoader()
+        self.wikiart_loader.failed.connect(self.wikiart_image_failed)
+
         layout = QHBoxLayout()
         self.setLayout(layout)
 
@@ -173,11 +179,24 @@ class StyleImageMenu(QWidget):
         self.stylization_switch_container.setLayout(self.stylization_switch_container_layout)
         stylization_controls_container_layout.addWidget(self.stylization_switch_container)
 
-        stylize_button = QPushButton('Stylize')
+        self.stylize_button = QPushButton('Stylize')
         icon = QIcon(QPixmap('assets/icons/shuffle.png'))
-        stylize_button.setIcon(icon)
-        stylize_button.clicked.connect(self.stylize_button_click)
-        stylization_controls_container_layout.addWidget(stylize_button)
+        self.stylize_button.setIcon(icon)
+        self.stylize_button.setDisabled(True)  # enabled when models are loaded, see models_ready()
+        self.stylize_button.clicked.connect(self.stylize_button_click)
+        stylization_controls_container_layout.addWidget(self.stylize_button)
+
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.setDisabled(True)
+        self.cancel_button.clicked.connect(self.cancel_button_click)
+        stylization_controls_container_layout.addWidget(self.cancel_button)
+
+        self.stylization_progress_bar = QProgressBar()
+        self.stylization_progress_bar.setRange(0, 100)
+        stylization_controls_container_layout.addWidget(self.stylization_progress_bar)
+
+        self.stylization_error_label = StylizationErrorLabel()
+        stylization_controls_container_layout.addWidget(self.stylization_error_label)
 
         # result_image_container
         result_image_container_layout = QVBoxLayout()
@@ -199,61 +218,138 @@ class StyleImageMenu(QWidget):
         self.use_vae_style_transformer = state
 
     def stylize_button_click(self):
-        """Callback to stylize button"""
-        StyleTransfer.set_mode(StyleTransfer.StyleTransferMode.IMAGE)  # set proper stylization models as active
-        content_image_path = self.upper_stylization_image_path
-        style_image_path = self.lower_stylization_image_path
+        """Callback to stylize button, starts stylization in a separate thread. A click while an image is stylized
+        queues the new request, only the latest one is kept and requests equal to the running or the queued one
+        are ignored"""
+        request = (self.use_vae_style_transformer, self.upper_stylization_image_path,
+                   self.lower_stylization_image_path, (100 - self.stylization_slider.value()) / 100,
+                   os.getenv("TILED_OUTPUT"))
+
+        if self.stylization_thread is not None:
+            if request != self.running_request:
+                self.pending_request = request
+            return
 
-        if self.use_vae_style_transformer:
-            self.stylize_vae_algorithm(content_image_path, style_image_path)
-        else:
-            self.stylize_classic_algorithm(content_image_path, style_image_path)
+        self.start_stylization(request)
 
+    def start_stylization(self, request: tuple):
+        """Start stylization worker
+        :param request: tuple of the model switch, content image path, style image path, content blending ratio
+        and tiled output setting"""
+        use_vae_style_transformer, content_image_path, style_image_path, content_blending_ratio, _ = request
+        result_image_path = f'{StyleImageMenu.STYLE_IMAGE_RESULTS}/result-{StyleImageMenu.num_of_results}.png'
+        if use_vae_style_transformer:
+            stylizing_function = self.stylize_vae_algorithm
+        else:
+            # paths of the image models are bound before the worker starts, it never reads the active models
+            stylizing_function = functools.partial(
+                self.stylize_classic_algorithm,
+                model_paths=StyleTransfer.get_model_paths(StyleTransfer.StyleTransferMode.IMAGE))
+
+        self.running_request = request
+        self.stylization_progress_bar.setValue(0)
+        self.stylization_error_label.hide()
+        self.cancel_button.setDisabled(False)
+
+        self.stylization_thread = QThread()
+        self.stylization_worker = ImageStylizationWorker(stylizing_function, content_image_path, style_image_path,
+                                                         content_blending_ratio, result_image_path)
+        self.stylization_worker.moveToThread(self.stylization_thread)
+        self.stylization_thread.started.connect(self.stylization_worker.run)
+        self.stylization_worker.progress.connect(self.stylization_progress_bar.setValue)
+        self.stylization_worker.finished.connect(self.stylization_finished)
+        self.stylization_worker.finished.connect(self.right_menu.add_recent_artwork)
+        self.stylization_worker.finished.connect(self.stylization_thread.quit)
+        self.stylization_worker.cancelled.connect(self.stylization_thread.quit)
+        self.stylization_worker.cancelled.connect(self.stylization_cancelled)
+        self.stylization_worker.failed.connect(self.stylization_thread.quit)
+        self.stylization_worker.failed.connect(self.stylization_failed)
+        self.stylization_thread.finished.connect(self.stylization_worker.deleteLater)
+        self.stylization_thread.finished.connect(self.stylization_thread.deleteLater)
+        self.stylization_thread.finished.connect(self.stylization_thread_finished)
+        self.stylization_thread.start()
+
+    def cancel_button_click(self):
+        """Callback to cancel button, stops the running stylization and drops the queued one"""
+        self.pending_request = None
+        if self.stylization_worker is not None:
+            self.stylization_worker.cancel()
+
+    def stylization_finished(self, result_image_path: str):
+        """Callback to stylization finished signal, shows the result
+        :param result_image_path: path of the stylized image"""
+        self.result_image_path = result_image_path
         pixmap = QPixmap(self.result_image_path)
         scaled_pixmap = pixmap.scaled(self.result_image.size(), Qt.AspectRatioMode.KeepAspectRatio,
                                       Qt.TransformationMode.SmoothTransformation)
         self.result_image.setPixmap(scaled_pixmap)
 
         StyleImageMenu.num_of_results += 1
-        self.right_menu.add_recent_artwork(self.result_image_path)
 
-    def stylize_classic_algorithm(self, content_image_path: str, style_image_path: str):
-        if self.is_content_image_from_url:
-            content_image = preprocess_image(load_img_from_url(content_image_path), 384)
+    def stylization_cancelled(self):
+        """Callback to stylization cancelled signal"""
+        self.stylization_progress_bar.setValue(0)
+
+    def stylization_failed(self, message: str):
+        """Callback to stylization failed signal, shows the error
+        :param message: description of the error"""
+        self.stylization_progress_bar.setValue(0)
+        self.stylization_error_label.show_error(f'Stylization failed: {message}')
+
+    def stylization_thread_finished(self):
+        """Callback to finished stylization thread, starts the queued request"""
+        self.stylization_thread = None
+        self.stylization_worker = None
+        self.running_request = None
+        self.cancel_button.setDisabled(True)
+
+        if self.pending_request is not None:
+            request, self.pending_request = self.pending_request, None
+            self.start_stylization(request)
+
+    def stylize_classic_algorithm(self, content_image_path: str, style_image_path: str,
+                                  content_blending_ratio: float, result_image_path: str,
+                                  progress_signal: pyqtSignal(int), cancel_event: threading.Event,
+                                  model_paths: tuple = None) -> str:
+        content_image = load_img_from_url(content_image_path) if ImageCache.is_url(content_image_path) \
+            else load_img(content_image_path)
+        style_image = preprocess_image(load_img_from_url(style_image_path) if ImageCache.is_url(style_image_path)
+                                       else load_img(style_image_path), 256)
+        ImageStylizationWorker.check_cancelled(cancel_event)
+
+        style_bottleneck = StyleTransfer.get_style_bottleneck(style_image, model_paths)
+        progress_signal.emit(10)
+        ImageStylizationWorker.check_cancelled(cancel_event)
+
+        if os.getenv("TILED_OUTPUT") == "TRUE":
+            result_image = StyleTransfer.stylize_image_tiled(content_image, style_bottleneck, content_blending_ratio,
+                                                             progress_signal, cancel_event, model_paths)
         else:
-            content_image = preprocess_image(load_img(content_image_path), 384)
-
-        if self.is_style_image_from_url:
-            style_image = preprocess_image(load_img_from_url(style_image_path), 256)
-        else:
-            style_image = preprocess_image(load_img(style_image_path), 256)
-
-        content_blending_ratio = (100 - self.stylization_slider.value()) / 100  # define content blending ratio between [0..1].
-
-        result_image = StyleTransfer.stylize_image(content_image, style_image, content_blending_ratio)
-        self.result_image_path = f'{StyleImageMenu.STYLE_IMAGE_RESULTS}/result-{StyleImageMenu.num_of_results}.png'
-        tf.keras.utils.save_img(self.result_image_path, result_image)
-
-    def stylize_vae_algorithm(self, content_image_path: str, style_image_path: str):
-        if self.is_content_image_from_url:
-            response = requests.get(content_image_path)
-            response.raise_for_status()
-            content_image = Image.open(BytesIO(response.content))
-        else:
-            content_image = Image.open(content_image_path).convert('RGB')
-
-        if self.is_style_image_from_url:
-            response = requests.get(style_image_path)
-            response.raise_for_status()
-            style_image = Image.open(BytesIO(response.content))
-        else:
-            style_image = Image.open(style_image_path).convert('RGB')
+            result_image = StyleTransfer.stylize_with_style_bottleneck(preprocess_image(content_image, 384),
+                                                                       style_bottleneck, content_blending_ratio,
+                                                                       model_paths)
+        ImageStylizationWorker.check_cancelled(cancel_event)
+
+        import tensorflow as tf  # already loaded by the interpreters, only saving the result needs it in this menu
+        tf.keras.utils.save_img(result_image_path, result_image)
+        return result_image_path
+
+    def stylize_vae_algorithm(self, content_image_path: str, style_image_path: str, content_blending_ratio: float,
+                              result_image_path: str, progress_signal: pyqtSignal(int),
+                              cancel_event: threading.Event) -> str:
+        if self.style_transformer_vae is None:
+            from logic.style_transfer_vae import StyleTransferVAE
+            self.style_transformer_vae = StyleTransferVAE()
+
+        content_image = Image.fromarray(get_image_cache().get_array(content_image_path))
+        style_image = Image.fromarray(get_image_cache().get_array(style_image_path))
+        ImageStylizationWorker.check_cancelled(cancel_event)
 
         result_image = self.style_transformer_vae.run_style_transfer(content_image, style_image)
+        ImageStylizationWorker.check_cancelled(cancel_event)
 
-        self.result_image_path = f'{StyleImageMenu.STYLE_IMAGE_RESULTS}/result-{StyleImageMenu.num_of_results}.png'
-
-        result_image.save(self.result_image_path)
+        result_image.save(result_image_path)
+        return result_image_path
 
     def open_content_image_from_file(self) -> None:
         """Callback to open button"""
@@ -261,7 +357,9 @@ class StyleImageMenu(QWidget):
         if file:
             if file[0] == '':
                 return
-            pixmap = QPixmap(file[0])
+            pixmap = QPixmap()
+            # stylization decodes the content image from these cached bytes instead of reading the file again
+            pixmap.loadFromData(get_image_cache().get_bytes(file[0]))
             self.upper_stylization_image_path = file[0]
             scaled_pixmap = pixmap.scaled(self.upper_stylization_image.size(), Qt.AspectRatioMode.KeepAspectRatio,
                                           Qt.TransformationMode.SmoothTransformation)
@@ -274,7 +372,9 @@ class StyleImageMenu(QWidget):
         if file:
             if file[0] == '':
                 return
-            pixmap = QPixmap(file[0])
+            pixmap = QPixmap()
+            # the style bottleneck is predicted from the cached bytes, so the file is read once
+            pixmap.loadFromData(get_image_cache().get_bytes(file[0]))
             self.lower_stylization_image_path = file[0]
             scaled_pixmap = pixmap.scaled(self.lower_stylization_image.size(), Qt.AspectRatioMode.KeepAspectRatio,
                                           Qt.TransformationMode.SmoothTransformation)
@@ -282,17 +382,15 @@ class StyleImageMenu(QWidget):
             self.is_style_image_from_url = False
 
     def open_random_wikiart_content_image(self) -> None:
-        """Callback to random wikiArt image button"""
-        loading_succeded = False
-        while not loading_succeded:
-            response = requests.get('https://www.wikiart.org/en/App/Painting/MostViewedPaintings')
-            response.raise_for_status()
-            random_image_url = random.choice([x['image'] for x in response.json()])
-            try:
-                data = requests.get(random_image_url).content
-                loading_succeded = True
-            except:
-                continue
+        """Callback to random wikiArt image button, the painting is taken in a separate thread"""
+        self.wikiart_loader.load(self.set_wikiart_content_image)
+
+    def open_random_wikiart_style_image(self) -> None:
+        """Callback to random wikiArt image button, the painting is taken in a separate thread"""
+        self.wikiart_loader.load(self.set_wikiart_style_image)
+
+    def set_wikiart_content_image(self, random_image_url: str, data: bytes) -> None:
+        """Callback to WikiArt worker finished signal for the content image"""
         pixmap = QPixmap()
         pixmap.loadFromData(data)
         scaled_pixmap = pixmap.scaled(self.lower_stylization_image.size(), Qt.AspectRatioMode.KeepAspectRatio,
@@ -301,18 +399,8 @@ class StyleImageMenu(QWidget):
         self.upper_stylization_image_path = random_image_url
         self.is_content_image_from_url = True
 
-    def open_random_wikiart_style_image(self) -> None:
-        """Callback to random wikiArt image button"""
-        loading_succeded = False
-        while not loading_succeded:
-            response = requests.get('https://www.wikiart.org/en/App/Painting/MostViewedPaintings')
-            response.raise_for_status()
-            random_image_url = random.choice([x['image'] for x in response.json()])
-            try:
-                data = requests.get(random_image_url).content
-                loading_succeded = True
-            except:
-                continue
+    def set_wikiart_style_image(self, random_image_url: str, data: bytes) -> None:
+        """Callback to WikiArt worker finished signal for the style image"""
         pixmap = QPixmap()
         pixmap.loadFromData(data)
         scaled_pixmap = pixmap.scaled(self.lower_stylization_image.size(), Qt.AspectRatioMode.KeepAspectRatio,
@@ -411,6 +499,47 @@ class RightMenu(QWidget):
             images[i].setPixmap(QPixmap(scaled_pixmap))
 
 
+class ImageStylizationWorker(QObject):
+    """Class defining worker used for image stylization in a separate thread, it can be cancelled between steps
+    of the stylization and between batches of tiles"""
+    finished = pyqtSignal(str)
+    progress = pyqtSignal(int)
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, stylizing_function, *args, **kwargs):
+        super().__init__()
+        self.stylizing_function = stylizing_function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        try:
+            result_path = self.stylizing_function(*self.args, progress_signal=self.progress,
+                                                  cancel_event=self.cancel_event, **self.kwargs)
+        except StylizationCancelled:
+            self.cancelled.emit()
+            return
+        except Exception as error:
+            logging.getLogger().exception(f'Image stylization failed: {error}')
+            self.failed.emit(str(error))
+            return
+
+        self.progress.emit(100)
+        self.finished.emit(result_path)
+
+    def cancel(self):
+        """Request cancellation, it is safe to call from any thread"""
+        self.cancel_event.set()
+
+    @staticmethod
+    def check_cancelled(cancel_event: threading.Event):
+        """:raise StylizationCancelled: if cancellation was requested"""
+        if cancel_event.is_set():
+            raise StylizationCancelled()
+
+
 class StyleButton(QPushButton):
 
     def __init__(self, label: str, icon_image_path: str, button_name: str = '', callback=None):
@@ -1,5 +1,5 @@
-import random
-import requests
+import logging
+
 from PyQt6.QtCore import Qt, QUrl, QObject, pyqtSignal, QThread
 from PyQt6.QtGui import QPixmap, QIcon
 from PyQt6.QtMultimedia import QMediaPlayer
@@ -7,11 +7,14 @@ from PyQt6.QtMultimediaWidgets import QVideoWidget
 from PyQt6.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QGridLayout, QSlider, QFileDialog, \
     QStyle, QProgressBar
 
+from logic.image_cache import get_image_cache
 from logic.preprocessing import preprocess_image, load_img_from_url, load_img
 from logic.style_transfer import StyleTransfer
+from widgets.stylization_status import StylizationErrorLabel, StylizationStatusMixin
+from widgets.wikiart_loader import WikiArtImageLoader
 
 
-class StyleVideoMenu(QWidget):
+class StyleVideoMenu(StylizationStatusMixin, QWidget):
     """Class defining GUI for video style transfer module"""
 
     is_style_image_from_url = False
@@ -19,6 +22,9 @@ class StyleVideoMenu(QWidget):
     def __init__(self):
         super().__init__()
 
+        self.wikiart_loader = WikiArtImageLoader()
+        self.wikiart_loader.failed.connect(self.wikiart_image_failed)
+
         layout = QHBoxLayout()
         self.setLayout(layout)
 
@@ -142,9 +148,13 @@ class StyleVideoMenu(QWidget):
         self.stylize_button = QPushButton('Stylize')
         icon = QIcon(QPixmap('assets/icons/shuffle.png'))
         self.stylize_button.setIcon(icon)
+        self.stylize_button.setDisabled(True)  # enabled when models are loaded, see models_ready()
         self.stylize_button.clicked.connect(self.stylize_button_click)
         stylization_controls_container_layout.addWidget(self.stylize_button)
 
+        self.stylization_error_label = StylizationErrorLabel()
+        stylization_controls_container_layout.addWidget(self.stylization_error_label)
+
         # result_video_container
         result_video_container_layout = QVBoxLayout()
         self.result_media_player = QMediaPlayer()
@@ -160,6 +170,9 @@ class StyleVideoMenu(QWidget):
         self.result_media_player.setPosition(0)
         self.stylization_progress_bar = QProgressBar()
         self.stylization_progress_bar.setRange(0, 100)
+        self.stylization_statistics_label = QLabel()
+        self.stylization_statistics_label.setWordWrap(True)
+        self.stylization_statistics_label.hide()
         self.video_position_slider = QSlider(Qt.Orientation.Horizontal)
         self.video_position_slider.setRange(0, self.upper_stylization_media_player.duration())
         self.video_position_slider.sliderMoved.connect(self.set_video_position)
@@ -168,6 +181,7 @@ class StyleVideoMenu(QWidget):
         self.play_button.clicked.connect(self.play_button_click)
         result_video_container_layout.addWidget(self.result_video)
         result_video_container_layout.addWidget(self.stylization_progress_bar)
+        result_video_container_layout.addWidget(self.stylization_statistics_label)
         result_video_container_layout.addWidget(self.video_position_slider)
         result_video_container_layout.addWidget(self.play_button)
         result_video_container.setLayout(result_video_container_layout)
@@ -182,8 +196,11 @@ class StyleVideoMenu(QWidget):
 
     def stylize_button_click(self) -> None:
         """Callback to stylize button, starts stylization process in a separate thread"""
-        StyleTransfer.set_mode(StyleTransfer.StyleTransferMode.VIDEO)  # set proper stylization models as active
+        # the worker gets paths of the video models, the transform model also identifies the job when it is resumed
+        model_paths = StyleTransfer.get_model_paths(StyleTransfer.StyleTransferMode.VIDEO)
         self.stylize_button.setDisabled(True)
+        self.stylization_error_label.hide()
+        self.stylization_statistics_label.hide()
         self.reset_videos_state()
 
         style_image_path = self.lower_stylization_image_path
@@ -197,13 +214,16 @@ class StyleVideoMenu(QWidget):
 
         self.stylization_thread = QThread()
         self.stylization_worker = StylizationWorker(StyleTransfer.stylize_video, content_video_path, style_image,
-                                                    content_blending_ratio)
+                                                    content_blending_ratio, model_paths=model_paths)
         self.stylization_worker.moveToThread(self.stylization_thread)
         self.stylization_thread.started.connect(self.stylization_worker.run)
         self.stylization_worker.progress.connect(self.update_progress_bar)
         self.stylization_worker.finished.connect(self.stylization_thread.quit)
         self.stylization_worker.finished.connect(self.stylization_finished)
         self.stylization_worker.finished.connect(self.stylization_worker.deleteLater)
+        self.stylization_worker.failed.connect(self.stylization_thread.quit)
+        self.stylization_worker.failed.connect(self.stylization_failed)
+        self.stylization_worker.failed.connect(self.stylization_worker.deleteLater)
         self.stylization_thread.finished.connect(self.stylization_thread.deleteLater)
         self.stylization_thread.start()
 
@@ -257,6 +277,23 @@ class StyleVideoMenu(QWidget):
         self.result_media_player.play()
         self.upper_stylization_media_player.play()
         self.stylize_button.setDisabled(False)
+        self.show_stylization_statistics()
+
+    def show_stylization_statistics(self) -> None:
+        """Show how many frames of the last stylized video were taken from neighbouring frames instead of the models"""
+        statistics = StyleTransfer.last_video_statistics
+        if statistics is None or statistics.frames == 0:
+            return  # every segment was already stylized by a previous run
+        self.stylization_statistics_label.setText(f'{statistics.skipped_frames()} of {statistics.frames} frames '
+                                                  f'skipped the models ({statistics})')
+        self.stylization_statistics_label.show()
+
+    def stylization_failed(self, message: str) -> None:
+        """Callback to stylization failed signal, shows the error and allows starting stylization again
+        :param message: description of the error"""
+        self.stylization_progress_bar.setValue(0)
+        self.stylization_error_label.show_error(f'Stylization failed: {message}')
+        self.stylize_button.setDisabled(False)
 
     def reset_videos_state(self) -> None:
         """Reset both of the videos to their starting point"""
@@ -286,7 +323,9 @@ class StyleVideoMenu(QWidget):
         if file:
             if file[0] == '':
                 return
-            pixmap = QPixmap(file[0])
+            pixmap = QPixmap()
+            # the style image is read from these cached bytes when stylization starts
+            pixmap.loadFromData(get_image_cache().get_bytes(file[0]))
             self.lower_stylization_image_path = file[0]
             scaled_pixmap = pixmap.scaled(self.lower_stylization_image.size(), Qt.AspectRatioMode.KeepAspectRatio,
                                           Qt.TransformationMode.SmoothTransformation)
@@ -294,17 +333,13 @@ class StyleVideoMenu(QWidget):
             self.is_style_image_from_url = False
 
     def open_random_wikiart_style_image(self) -> None:
-        """Callback to random wikiArt image button"""
-        loading_succeded = False
-        while not loading_succeded:
-            response = requests.get('https://www.wikiart.org/en/App/Painting/MostViewedPaintings')
-            response.raise_for_status()
-            random_image_url = random.choice([x['image'] for x in response.json()])
-            try:
-                data = requests.get(random_image_url).content
-                loading_succeded = True
-            except:
-                continue
+        """Callback to random wikiArt image button, the painting is taken in a separate thread"""
+        self.wikiart_loader.load(self.set_wikiart_style_image)
+
+    def set_wikiart_style_image(self, random_image_url: str, data: bytes) -> None:
+        """Callback to WikiArt worker finished signal
+        :param random_image_url: url of the painting
+        :param data: content of the painting"""
         pixmap = QPixmap()
         pixmap.loadFromData(data)
         scaled_pixmap = pixmap.scaled(self.lower_stylization_image.size(), Qt.AspectRatioMode.KeepAspectRatio,
@@ -338,6 +373,7 @@ class StylizationWorker(QObject):
     """Class defining worker used for stylization process in a separate thread"""
     finished = pyqtSignal(str)
     progress = pyqtSignal(int)
+    failed = pyqtSignal(str)
 
     def __init__(self, stylizing_function, *args, **kwargs):
         super().__init__()
@@ -346,5 +382,11 @@ class StylizationWorker(QObject):
         self.kwargs = kwargs
 
     def run(self):
-        result_path = self.stylizing_function(*self.args, progress_signal=self.progress, **self.kwargs)
+        try:
+            result_path = self.stylizing_function(*self.args, progress_signal=self.progress, **self.kwargs)
+        except Exception as error:
+            logging.getLogger().exception(f'Video stylization failed: {error}')
+            self.failed.emit(str(error))
+            return
+
         self.finished.emit(result_path)
@@ -0,0 +1,37 @@
+from PyQt6.QtWidgets import QLabel
+
+
+class StylizationErrorLabel(QLabel):
+    """Label of a stylization menu showing why stylization failed or cannot start, hidden until there is an error"""
+
+    def __init__(self):
+        super().__init__()
+        self.setWordWrap(True)
+        self.setStyleSheet('color: #c62828')
+        self.hide()
+
+    def show_error(self, message: str) -> None:
+        """
+        :param message: text of the error
+        """
+        self.setText(message)
+        self.show()
+
+
+class StylizationStatusMixin:
+    """Callbacks shared by stylization menus, a menu using it defines stylize_button and stylization_error_label"""
+
+    def models_ready(self) -> None:
+        """Callback to the signal of loaded models"""
+        self.stylize_button.setDisabled(False)
+
+    def models_failed(self, message: str) -> None:
+        """Callback to the signal of models which could not be loaded, stylization stays disabled
+        :param message: description of the error"""
+        self.stylize_button.setDisabled(True)
+        self.stylization_error_label.show_error(f'Models could not be loaded: {message}')
+
+    def wikiart_image_failed(self, message: str) -> None:
+        """Callback to WikiArt loader failed signal, shows the error
+        :param message: description of the error"""
+        self.stylization_error_label.show_error(f'WikiArt painting could not be loaded: {message}')
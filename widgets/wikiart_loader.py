@@ -0,0 +1,72 @@
+import logging
+
+from PyQt6.QtCore import QObject, pyqtSignal, QThread
+
+from logic.image_cache import get_image_cache
+from logic.wikiart import get_wikiart_client
+
+
+class WikiArtImageLoader(QObject):
+    """Class taking random WikiArt paintings for a menu in a separate thread, one painting at a time. A request made
+    while a painting is loaded is started after it, only the latest such request is kept"""
+    failed = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.wikiart_thread = None
+        self.wikiart_worker = None
+        self.callback = None
+        self.pending_callback = None
+
+    def load(self, callback) -> None:
+        """Take a random WikiArt painting
+        :param callback: function called with url and content of the painting"""
+        if self.wikiart_thread is not None:
+            self.pending_callback = callback
+            return
+
+        self.callback = callback
+        self.wikiart_thread = QThread()
+        self.wikiart_worker = WikiArtImageWorker()
+        self.wikiart_worker.moveToThread(self.wikiart_thread)
+        self.wikiart_thread.started.connect(self.wikiart_worker.run)
+        self.wikiart_worker.finished.connect(self.image_loaded)
+        self.wikiart_worker.finished.connect(self.wikiart_thread.quit)
+        self.wikiart_worker.failed.connect(self.failed)
+        self.wikiart_worker.failed.connect(self.wikiart_thread.quit)
+        self.wikiart_thread.finished.connect(self.wikiart_worker.deleteLater)
+        self.wikiart_thread.finished.connect(self.wikiart_thread.deleteLater)
+        self.wikiart_thread.finished.connect(self.wikiart_thread_finished)
+        self.wikiart_thread.start()
+
+    def image_loaded(self, random_image_url: str, data: bytes) -> None:
+        """Callback to WikiArt worker finished signal, passes the painting to the callback of the request"""
+        self.callback(random_image_url, data)
+
+    def wikiart_thread_finished(self) -> None:
+        """Callback to finished WikiArt thread, starts the queued request"""
+        self.wikiart_thread = None
+        self.wikiart_worker = None
+        self.callback = None
+
+        if self.pending_callback is not None:
+            callback, self.pending_callback = self.pending_callback, None
+            self.load(callback)
+
+
+class WikiArtImageWorker(QObject):
+    """Class defining worker used for taking a random WikiArt painting in a separate thread"""
+    finished = pyqtSignal(str, bytes)
+    failed = pyqtSignal(str)
+
+    def run(self):
+        try:
+            random_image_url, data = get_wikiart_client().get_random_image(timeout=60)
+        except Exception as error:
+            logging.getLogger().warning(f'Could not load a random WikiArt painting: {error}')
+            self.failed.emit(str(error))
+            return
+
+        # stylization reads the painting from the cache instead of downloading it again
+        get_image_cache().put_bytes(random_image_url, data)
+        self.finished.emit(random_image_url, data)